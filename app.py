@@ -1,11 +1,29 @@
-import hmac
-import os
-
 import streamlit as st
-from gnews import GNews
-from groq import Groq
 
-from xau_asia_private import render_private_xau_asia_entry_agent
+from terminal_ict import (
+    MODO_BATCH,
+    MODO_CHAMADA_UNICA,
+    MODO_JSON_ANALISTAS,
+    MODO_PARALELO,
+    PERFIL_GESTOR,
+    PERFIS_ANALISTAS,
+    PERIODOS,
+    TEMAS_KEYS,
+    aquecer_conexoes_groq,
+    chamar_ia_groq_json,
+    chamar_ia_groq_paralelo,
+    chamar_ia_groq_stream,
+    consultar_ia_groq_batch,
+    enviar_ia_groq_batch,
+    formatar_noticias,
+    hash_payload,
+    news_executor,
+    preparar_payload,
+    render_private_unlock_sidebar,
+    resposta_ok,
+    resumir_resposta,
+    sincronizar_tema,
+)
 
 
 st.set_page_config(
@@ -19,71 +37,10 @@ if "dados_terminal" not in st.session_state:
 if "private_unlocked" not in st.session_state:
     st.session_state["private_unlocked"] = False
 
-
-def _get_secret(name: str) -> str | None:
-    # Prefer Streamlit secrets, fallback to environment variables.
-    try:
-        if name in st.secrets:
-            val = st.secrets[name]
-            if isinstance(val, str) and val.strip():
-                return val.strip()
-    except Exception:
-        pass
-
-    val = os.environ.get(name)
-    return val.strip() if isinstance(val, str) and val.strip() else None
-
-
-def _render_private_unlock_sidebar() -> None:
-    st.sidebar.divider()
-    st.sidebar.subheader("Private")
-
-    if st.session_state.get("private_unlocked"):
-        st.sidebar.success("Unlocked")
-        if st.sidebar.button("Logout"):
-            st.session_state["private_unlocked"] = False
-        return
-
-    password = st.sidebar.text_input("Password", type="password")
-    if st.sidebar.button("Unlock"):
-        expected = _get_secret("PRIVATE_PASSWORD")
-        if not expected:
-            st.sidebar.error("Missing PRIVATE_PASSWORD in secrets/env.")
-            return
-        if hmac.compare_digest(password or "", expected):
-            st.session_state["private_unlocked"] = True
-            st.sidebar.success("Unlocked")
-        else:
-            st.sidebar.error("Invalid password.")
-
-
-def chamar_ia_groq(perfil: str, texto: str) -> str:
-    try:
-        key = _get_secret("GROQ_API_KEY")
-        if not key:
-            return "Erro: GROQ_API_KEY nao configurada (secrets/env)."
-
-        client = Groq(api_key=key)
-        messages = [
-            {
-                "role": "system",
-                "content": f"Voce e um {perfil} especializado em ICT. Responda em PORTUGUES tecnico e direto.",
-            },
-            {"role": "user", "content": f"Analise estes dados sob a otica ICT:\n\n{texto[:3000]}"},
-        ]
-
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=800,
-            timeout=20,
-        )
-        if not completion.choices:
-            return "A IA nao retornou resposta."
-        return completion.choices[0].message.content
-    except Exception as e:
-        return f"Erro na consulta ({perfil}): {str(e)}"
+try:
+    aquecer_conexoes_groq()
+except RuntimeError:
+    pass  # Sem chave: o erro aparece na primeira consulta.
 
 
 with st.sidebar:
@@ -91,35 +48,55 @@ with st.sidebar:
     st.info("Acesso institucional liberado")
     st.divider()
 
-    temas_full = {
-        "COT & Institutional Bias": "Commitment of Traders CFTC smart money",
-        "Forex: ICT Majors": "DXY EURUSD price action analysis",
-        "Metais & Liquidez": "Gold Silver liquidity price action",
-        "Indices: S&P500 / Nasdaq (ICT)": "S&P500 Nasdaq price action",
-        "Geopolitica & Macro": "Geopolitics global market news",
-    }
+    escolha = st.selectbox("Selecione o fluxo:", TEMAS_KEYS)
+    periodo = st.selectbox("Janela de tempo:", PERIODOS, index=3)
 
-    escolha = st.selectbox("Selecione o fluxo:", list(temas_full.keys()))
-    periodo = st.selectbox("Janela de tempo:", ["12h", "24h", "48h", "7d", "30d"], index=3)
+    if st.button("Sincronizar sinais ICT", disabled="news_future" in st.session_state):
+        # Fetch runs in a worker thread; the fragment below polls it so the UI stays responsive.
+        st.session_state["news_future"] = news_executor().submit(sincronizar_tema, escolha, periodo)
 
-    if st.button("Sincronizar sinais ICT"):
-        with st.spinner("Buscando dados..."):
-            try:
-                gn = GNews(language="en", country="US", period=periodo, max_results=10)
-                news = gn.get_news(temas_full[escolha])
+    if "news_future" in st.session_state:
+
+        @st.fragment(run_every=1.0)
+        def _aguardar_sincronizacao() -> None:
+            fut = st.session_state.get("news_future")
+            if fut is None:
+                return
+            if not fut.done():
+                st.caption("Buscando dados em segundo plano...")
+                return
 
+            del st.session_state["news_future"]
+            try:
+                news = fut.result()
                 if news:
-                    bruto = ""
-                    for n in news:
-                        bruto += f"FONTE: {n['publisher']['title']} | INFO: {n['title']}\n---\n"
-                    st.session_state["dados_terminal"] = bruto
-                    st.success("Dados sincronizados.")
+                    st.session_state["dados_terminal"] = formatar_noticias(news)
+                    st.session_state["news_status"] = ("success", "Dados sincronizados.")
                 else:
-                    st.warning("Nenhum dado encontrado.")
+                    st.session_state["news_status"] = ("warning", "Nenhum dado encontrado.")
             except Exception as e:
-                st.error(f"Erro: {e}")
+                st.session_state["news_status"] = ("error", f"Erro: {e}")
+            st.rerun()
+
+        _aguardar_sincronizacao()
+
+    if "news_status" in st.session_state:
+        nivel, msg = st.session_state.pop("news_status")
+        getattr(st, nivel)(msg)
+
+    modo_consulta = st.radio(
+        "Modo de consulta IA:",
+        [MODO_PARALELO, MODO_JSON_ANALISTAS, MODO_CHAMADA_UNICA, MODO_BATCH],
+        index=0,
+        help=(
+            "Paralelo: 3 perfis ao mesmo tempo + plano em streaming. "
+            "Analistas em JSON: 1 requisicao para os 3 perfis + plano em streaming. "
+            "Chamada unica: 1 requisicao JSON com as 4 secoes (menos tokens). "
+            "Batch: Groq Batch API, mais barato porem pode demorar bem mais."
+        ),
+    )
 
-    _render_private_unlock_sidebar()
+    render_private_unlock_sidebar()
 
 
 tab_public, tab_private = st.tabs(["Terminal ICT", "Gestao privada"])
@@ -135,42 +112,112 @@ with tab_public:
         height=150,
     )
 
-    if st.button("Executar analise institucional"):
-        if not noticias_campo or len(noticias_campo) < 10:
-            st.error("Sincronize os dados no menu lateral primeiro.")
-        else:
+    executar = st.button("Executar analise institucional")
+    if executar and (not noticias_campo or len(noticias_campo) < 10):
+        st.error("Sincronize os dados no menu lateral primeiro.")
+    elif noticias_campo and len(noticias_campo) >= 10:
+        payload = preparar_payload(noticias_campo)
+        # Last finished analysis, keyed by mode + payload hash: other widget reruns redraw it
+        # from session_state instead of dropping it (or re-calling Groq on the next click).
+        chave_analise = f"{modo_consulta}:{hash_payload(payload)}"
+        analise = st.session_state.get("analise")
+        if analise is not None and analise["chave"] != chave_analise:
+            analise = None
+
+        # Batch mode: submit once, keep the id in session_state and poll it from a fragment below;
+        # the script thread never waits on the (up to 24h) batch window.
+        lote = st.session_state.get("groq_batch")
+        if executar and analise is None and modo_consulta == MODO_BATCH:
+            executar = False
+            if lote is None or lote["chave"] != chave_analise:
+                try:
+                    lote = {"id": enviar_ia_groq_batch(list(PERFIS_ANALISTAS), payload), "chave": chave_analise}
+                    st.session_state["groq_batch"] = lote
+                except Exception as e:
+                    st.error(f"Erro ao enviar o batch: {e}")
+
+        respostas_lote = None
+        if lote is not None and lote["chave"] == chave_analise and lote.get("respostas") is not None:
+            respostas_lote = st.session_state.pop("groq_batch")["respostas"]
+        elif lote is not None and lote.get("respostas") is None:
+
+            @st.fragment(run_every=5.0)
+            def _aguardar_batch() -> None:
+                lote = st.session_state.get("groq_batch")
+                if lote is None or lote.get("respostas") is not None:
+                    return
+                try:
+                    respostas = consultar_ia_groq_batch(lote["id"], list(PERFIS_ANALISTAS))
+                except Exception as e:
+                    st.caption(f"Batch {lote['id']}: falha ao consultar ({e}), nova tentativa em instantes.")
+                    return
+                if respostas is None:
+                    st.caption(f"Batch {lote['id']} em processamento (janela de ate 24h)...")
+                    return
+                lote["respostas"] = respostas
+                st.rerun()
+
+            _aguardar_batch()
+
+        if analise is not None:
+            res_smart, res_retail, res_macro, plano = analise["paineis"]
+        elif respostas_lote is not None:
+            res_smart, res_retail, res_macro = respostas_lote
+            plano = None
+        elif executar:
+            plano = None
             with st.status("Processando vies institucional...", expanded=True):
-                col1, col2, col3 = st.columns(3)
+                if modo_consulta == MODO_CHAMADA_UNICA:
+                    res_smart, res_retail, res_macro, plano = chamar_ia_groq_json(
+                        [*PERFIS_ANALISTAS, PERFIL_GESTOR], payload
+                    )
+                else:
+                    consultar = {
+                        MODO_JSON_ANALISTAS: chamar_ia_groq_json,
+                    }.get(modo_consulta, chamar_ia_groq_paralelo)
+                    res_smart, res_retail, res_macro = consultar(list(PERFIS_ANALISTAS), payload)
+
+        if analise is not None or executar or respostas_lote is not None:
+            col1, col2, col3 = st.columns(3)
 
-                with col1:
-                    st.subheader("Institutional Flow")
-                    res_smart = chamar_ia_groq("Especialista em Smart Money ICT", noticias_campo)
-                    st.info(res_smart)
+            with col1:
+                st.subheader("Institutional Flow")
+                st.info(res_smart)
 
-                with col2:
-                    st.subheader("Retail Trap")
-                    res_retail = chamar_ia_groq("Analista de Inducao de Varejo", noticias_campo)
-                    st.error(res_retail)
+            with col2:
+                st.subheader("Retail Trap")
+                st.error(res_retail)
 
-                with col3:
-                    st.subheader("Daily Bias")
-                    res_macro = chamar_ia_groq("Estrategista Macro", noticias_campo)
-                    st.success(res_macro)
+            with col3:
+                st.subheader("Daily Bias")
+                st.success(res_macro)
 
             st.divider()
             st.subheader("Plano de execucao estrategica")
-            try:
-                res_final = chamar_ia_groq(
-                    "Gestor ICT Senior", f"Resumo institucional:\n{res_smart}\n{res_macro}"
-                )
-                st.markdown(f"> {res_final}")
-            except Exception as e:
-                st.error(f"Erro na sintese final: {e}")
+            if plano is not None:
+                st.markdown(f"> {plano}" if modo_consulta == MODO_CHAMADA_UNICA else plano)
+            elif not all(map(resposta_ok, (res_smart, res_retail, res_macro))):
+                st.warning("Sintese pulada: um dos analistas falhou.")
+            else:
+                try:
+                    contexto_plano = (
+                        f"Resumo institucional:\n{resumir_resposta(res_smart)}\n{resumir_resposta(res_macro)}"
+                    )
+                    plano = st.write_stream(chamar_ia_groq_stream(PERFIL_GESTOR, contexto_plano))
+                except Exception as e:
+                    st.error(f"Erro na sintese final: {e}")
+
+            paineis = (res_smart, res_retail, res_macro, plano)
+            if analise is None and all(isinstance(r, str) and resposta_ok(r) for r in paineis):
+                st.session_state["analise"] = {"chave": chave_analise, "paineis": paineis}
 
 with tab_private:
     if not st.session_state.get("private_unlocked"):
         st.warning("Area privada bloqueada. Desbloqueie no menu lateral (Private -> Unlock).")
     else:
+        # Imported on unlock only: the journal/SQLite/pattern modules stay out of the cold start.
+        from xau_asia_private import render_private_xau_asia_entry_agent
+
         render_private_xau_asia_entry_agent()
 
 st.markdown("---")
@@ -1,26 +1,56 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import json
-from typing import Any
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
 
+if TYPE_CHECKING:
+    import httpx
+    import requests
 
-def deepseek_chat_completion(
-    *,
-    api_key: str,
-    system_prompt: str,
-    user_prompt: str,
-    model: str = "deepseek-chat",
-    base_url: str = "https://api.deepseek.com/v1/chat/completions",
-    temperature: float = 0.2,
-    max_tokens: int = 900,
-    timeout_s: int = 20,
-) -> str:
+try:  # orjson is optional: faster encode/decode when installed, stdlib json otherwise
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
+
+@functools.lru_cache(maxsize=1)
+def _deepseek_session() -> requests.Session:
     """
-    Minimal DeepSeek chat completion via OpenAI-compatible REST.
-    Requires `requests` at runtime.
+    Session compartilhada (keep-alive) para api.deepseek.com: chamadas seguintes reutilizam a conexao TLS.
+    Retry curto apenas em erro de conexao e em 429/503 (respeitando Retry-After): o servidor recusou o pedido.
+    Sem retry em erro de leitura nem 502/504, onde o pedido (cobrado) pode ja ter sido processado.
     """
     import requests  # local import so app still runs without DeepSeek deps until used
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=2,
+        backoff_factor=0.2,
+        read=0,
+        status_forcelist=(429, 503),
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
 
+def _corpo(system_prompt: str, user_prompt: str, model: str, temperature: float, max_tokens: int) -> bytes:
     payload: dict[str, Any] = {
         "model": model,
         "messages": [
@@ -30,23 +60,162 @@ def deepseek_chat_completion(
         "temperature": float(temperature),
         "max_tokens": int(max_tokens),
     }
+    return _dumps(payload)
 
-    headers = {
+
+def _headers(api_key: str) -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
 
-    resp = requests.post(base_url, headers=headers, data=json.dumps(payload), timeout=int(timeout_s))
-    if resp.status_code == 402:
+
+def _checar_402(status_code: int) -> None:
+    if status_code == 402:
         raise RuntimeError(
             "DeepSeek retornou 402 (Payment Required): sua conta nao tem saldo/credito para usar a API. "
             "Ative billing/adicone credito ou use o fallback (Groq/heuristica)."
         )
-    resp.raise_for_status()
-    data = resp.json()
+
+
+_RESPOSTA_VAZIA = "DeepSeek: resposta vazia."
+
+
+def _conteudo(data: dict[str, Any]) -> str:
     choices = data.get("choices") or []
     if not choices:
-        return "DeepSeek: resposta vazia."
+        return _RESPOSTA_VAZIA
     msg = (choices[0] or {}).get("message") or {}
     content = msg.get("content")
-    return content if isinstance(content, str) and content.strip() else "DeepSeek: resposta vazia."
+    return content if isinstance(content, str) and content.strip() else _RESPOSTA_VAZIA
+
+
+# Prompt -> response cache (content hash, TTL + LRU). Only low temperatures are cached:
+# above that the same prompt is expected to give different answers.
+_CACHE_TTL_S = 300.0
+_CACHE_MAX_ENTRIES = 256
+_CACHE_MAX_TEMPERATURE = 0.3
+_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _chave_cache(
+    system_prompt: str, user_prompt: str, model: str, base_url: str, temperature: float, max_tokens: int
+) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for parte in (system_prompt, user_prompt, model, base_url, repr(float(temperature)), str(int(max_tokens))):
+        h.update(parte.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _cache_get(chave: str) -> str | None:
+    with _cache_lock:
+        item = _cache.get(chave)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > _CACHE_TTL_S:
+            del _cache[chave]
+            return None
+        _cache.move_to_end(chave)
+        return item[1]
+
+
+def _cache_put(chave: str, resposta: str) -> None:
+    with _cache_lock:
+        _cache[chave] = (time.monotonic(), resposta)
+        _cache.move_to_end(chave)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _usar_cache(cache: bool, temperature: float) -> bool:
+    return cache and float(temperature) <= _CACHE_MAX_TEMPERATURE
+
+
+def deepseek_chat_completion(
+    *,
+    api_key: str,
+    system_prompt: str,
+    user_prompt: str,
+    model: str = "deepseek-chat",
+    base_url: str = "https://api.deepseek.com/v1/chat/completions",
+    temperature: float = 0.2,
+    max_tokens: int = 900,
+    timeout_s: int = 20,
+    cache: bool = True,
+) -> str:
+    """
+    Minimal DeepSeek chat completion via OpenAI-compatible REST.
+    Requires `requests` at runtime.
+    Respostas para o mesmo prompt (temperature <= 0.3) sao reaproveitadas por 5 min; `cache=False` desliga.
+    """
+    chave = None
+    if _usar_cache(cache, temperature):
+        chave = _chave_cache(system_prompt, user_prompt, model, base_url, temperature, max_tokens)
+        hit = _cache_get(chave)
+        if hit is not None:
+            return hit
+
+    body = _corpo(system_prompt, user_prompt, model, temperature, max_tokens)
+    resp = _deepseek_session().post(base_url, headers=_headers(api_key), data=body, timeout=int(timeout_s))
+    _checar_402(resp.status_code)
+    resp.raise_for_status()
+    resposta = _conteudo(_loads(resp.content))
+    if chave is not None and resposta != _RESPOSTA_VAZIA:
+        _cache_put(chave, resposta)
+    return resposta
+
+
+def novo_cliente_async() -> httpx.AsyncClient:
+    """
+    AsyncClient para a DeepSeek (HTTP/2 quando `h2` esta instalado). Use dentro de `async with`
+    e passe como `client=` para varias chamadas reaproveitarem o mesmo pool; o chamador fecha o cliente.
+    """
+    import importlib.util
+
+    import httpx  # local import so app still runs without DeepSeek deps until used
+
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+
+
+async def deepseek_chat_completion_async(
+    *,
+    api_key: str,
+    system_prompt: str,
+    user_prompt: str,
+    model: str = "deepseek-chat",
+    base_url: str = "https://api.deepseek.com/v1/chat/completions",
+    temperature: float = 0.2,
+    max_tokens: int = 900,
+    timeout_s: int = 20,
+    cache: bool = True,
+    client: httpx.AsyncClient | None = None,
+) -> str:
+    """
+    Versao async de `deepseek_chat_completion` (httpx, HTTP/2 quando `h2` esta instalado),
+    para rodar em paralelo com outras chamadas no mesmo event loop. Requires `httpx` at runtime.
+    Usa o mesmo cache de respostas da versao sync. Sem `client`, abre e fecha um cliente so para esta chamada.
+    """
+    chave = None
+    if _usar_cache(cache, temperature):
+        chave = _chave_cache(system_prompt, user_prompt, model, base_url, temperature, max_tokens)
+        hit = _cache_get(chave)
+        if hit is not None:
+            return hit
+
+    body = _corpo(system_prompt, user_prompt, model, temperature, max_tokens)
+    if client is None:
+        async with novo_cliente_async() as proprio:
+            resp = await proprio.post(base_url, headers=_headers(api_key), content=body, timeout=timeout_s)
+    else:
+        resp = await client.post(base_url, headers=_headers(api_key), content=body, timeout=timeout_s)
+    _checar_402(resp.status_code)
+    resp.raise_for_status()
+    resposta = _conteudo(_loads(resp.content))
+    if chave is not None and resposta != _RESPOSTA_VAZIA:
+        _cache_put(chave, resposta)
+    return resposta
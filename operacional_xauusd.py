@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 from dataclasses import dataclass
 from datetime import date, datetime, time
 from enum import Enum
@@ -7,6 +8,14 @@ from typing import Any
 
 from zoneinfo import ZoneInfo
 
+_LISBON_TZ = ZoneInfo("Europe/Lisbon")
+
+
+def _q2(x: float) -> float:
+    # Preco em centavos: round() inteiro sobre x*100 evita o caminho decimal de round(x, 2)
+    # e da o mesmo resultado para precos com 2 casas (e somas/subtracoes deles).
+    return round(x * 100.0) / 100.0
+
 
 class Direcao(Enum):
     COMPRA = "BUY"
@@ -14,6 +23,9 @@ class Direcao(Enum):
     NEUTRO = "NEUTRAL"
 
 
+_DIRECAO_POR_NOME = {"COMPRA": Direcao.COMPRA, "VENDA": Direcao.VENDA}
+
+
 @dataclass(frozen=True)
 class JanelaPrioritaria:
     inicio: time
@@ -63,6 +75,27 @@ class NivelPsicologico:
     forca: int  # 1-5
 
 
+def _forca_nivel(nivel: float) -> int:
+    if nivel % 100 == 0:
+        return 5
+    if nivel % 50 == 0:
+        return 4
+    if nivel % 20 == 0:
+        return 3
+    if nivel % 10 == 0:
+        return 2
+    return 1
+
+
+@functools.lru_cache(maxsize=256)
+def _grade_niveis(base_idx: int, step: float) -> tuple[tuple[float, int], ...]:
+    # (valor, forca) dos niveis em base +/- 20 steps: so muda quando o preco cruza um step,
+    # entao ticks dentro do mesmo bucket reaproveitam a grade.
+    base = base_idx * step
+    valores = (base + offset_steps * step for offset_steps in range(-20, 21))
+    return tuple((v, _forca_nivel(v)) for v in valores if v > 0)
+
+
 class AnalisadorNiveisPsicologicos:
     def identificar_step_do_dia(self, preco_atual: float) -> float:
         if preco_atual < 4800:
@@ -72,15 +105,7 @@ class AnalisadorNiveisPsicologicos:
         return 20.0
 
     def calcular_forca_nivel(self, nivel: float) -> int:
-        if nivel % 100 == 0:
-            return 5
-        if nivel % 50 == 0:
-            return 4
-        if nivel % 20 == 0:
-            return 3
-        if nivel % 10 == 0:
-            return 2
-        return 1
+        return _forca_nivel(nivel)
 
     def identificar_tipo_nivel(self, nivel: float, preco_atual: float) -> str:
         if nivel < preco_atual:
@@ -91,25 +116,28 @@ class AnalisadorNiveisPsicologicos:
 
     def get_niveis_psicologicos(self, preco_atual: float, step_dia: float | None = None) -> list[NivelPsicologico]:
         step_dia = float(step_dia) if step_dia and step_dia > 0 else self.identificar_step_do_dia(preco_atual)
-        base = round(preco_atual / step_dia) * step_dia
-
-        niveis: list[NivelPsicologico] = []
-        for offset_steps in range(-40, 41):
-            nivel_valor = base + offset_steps * step_dia
-            if nivel_valor <= 0:
-                continue
-            nivel_valor = float(nivel_valor)
-            niveis.append(
-                NivelPsicologico(
-                    valor=nivel_valor,
-                    step=float(step_dia),
-                    tipo=self.identificar_tipo_nivel(nivel_valor, preco_atual),
-                    forca=self.calcular_forca_nivel(nivel_valor),
-                )
+
+        # Os 20 niveis mais proximos sempre caem em base +/- 20 steps (grade em cache por bucket);
+        # por chamada so ordena pela distancia e cria o dataclass para os 20 retornados.
+        grade = sorted(_grade_niveis(round(preco_atual / step_dia), step_dia), key=lambda vf: abs(vf[0] - preco_atual))
+
+        return [
+            NivelPsicologico(
+                valor=float(v),
+                step=step_dia,
+                tipo=self.identificar_tipo_nivel(v, preco_atual),
+                forca=forca,
             )
+            for v, forca in grade[:20]
+        ]
+
+
+# (open, high, low, close) ja convertidos para float.
+Ohlc = tuple[float, float, float, float]
+
 
-        niveis.sort(key=lambda x: abs(x.valor - preco_atual))
-        return niveis[:20]
+def candle_para_ohlc(candle: dict[str, float]) -> Ohlc:
+    return float(candle["open"]), float(candle["high"]), float(candle["low"]), float(candle["close"])
 
 
 class DetectorRejeicao:
@@ -118,39 +146,49 @@ class DetectorRejeicao:
         self.toque_tolerancia = float(toque_tolerancia)
 
     def detectar_rejeicao(self, candle: dict[str, float], nivel: float, direcao_esperada: str) -> tuple[bool, float]:
-        o = float(candle["open"])
-        h = float(candle["high"])
-        l = float(candle["low"])
-        c = float(candle["close"])
+        return self.detectar_rejeicao_ohlc(candle_para_ohlc(candle), nivel, direcao_esperada)
 
-        pavio_superior = h - max(c, o)
-        pavio_inferior = min(c, o) - l
+    def detectar_rejeicao_ohlc(self, ohlc: Ohlc, nivel: float, direcao_esperada: str) -> tuple[bool, float]:
+        forca = self.forca_pavio(ohlc, direcao_esperada)
+        if forca and self.tocou_nivel(ohlc, nivel, direcao_esperada):
+            return True, forca
+        return False, 0.0
 
+    def forca_pavio(self, ohlc: Ohlc, direcao_esperada: str) -> float:
+        """
+        Forca (1-3) do pavio de rejeicao na direcao, ou 0.0 se o pavio for menor que o minimo.
+        Nao depende do nivel: pode ser calculada uma vez por candle.
+        """
+        o, h, l, c = ohlc
         if direcao_esperada == "COMPRA":
-            tocou = l <= (nivel + self.toque_tolerancia)
-            if tocou and pavio_inferior >= self.tamanho_min_pavio:
-                forca = min(pavio_inferior / self.tamanho_min_pavio, 3.0)
-                return True, float(forca)
+            pavio = min(c, o) - l
+        elif direcao_esperada == "VENDA":
+            pavio = h - max(c, o)
+        else:
+            return 0.0
+        if pavio < self.tamanho_min_pavio:
+            return 0.0
+        return float(min(pavio / self.tamanho_min_pavio, 3.0))
 
+    def tocou_nivel(self, ohlc: Ohlc, nivel: float, direcao_esperada: str) -> bool:
+        _, h, l, _ = ohlc
+        if direcao_esperada == "COMPRA":
+            return l <= (nivel + self.toque_tolerancia)
         if direcao_esperada == "VENDA":
-            tocou = h >= (nivel - self.toque_tolerancia)
-            if tocou and pavio_superior >= self.tamanho_min_pavio:
-                forca = min(pavio_superior / self.tamanho_min_pavio, 3.0)
-                return True, float(forca)
-
-        return False, 0.0
+            return h >= (nivel - self.toque_tolerancia)
+        return False
 
 
 class CalculadorStopEstrutural:
     @staticmethod
     def calcular_stop(direcao: Direcao, nivel_testado: float, contexto: dict[str, Any], stop_min: float) -> float:
-        if direcao == Direcao.COMPRA:
+        if direcao is Direcao.COMPRA:
             minima = float(contexto.get("minima_recente", nivel_testado - stop_min))
             stop = min(minima - 2.0, nivel_testado - stop_min)
         else:
             maxima = float(contexto.get("maxima_recente", nivel_testado + stop_min))
             stop = max(maxima + 2.0, nivel_testado + stop_min)
-        return round(float(stop), 2)
+        return _q2(float(stop))
 
     @staticmethod
     def risco_pontos(entrada: float, stop: float) -> float:
@@ -161,21 +199,21 @@ class GeradorAlvos:
     def __init__(self, num_alvos: int):
         self.num_alvos = int(num_alvos)
 
-    def gerar_alvos(self, entrada: float, direcao: Direcao, step_dia: float) -> list[float]:
+    def gerar_alvos(
+        self, entrada: float, direcao: Direcao, step_dia: float, *, base: float | None = None
+    ) -> list[float]:
+        """
+        `base` (nivel da grade mais proximo da entrada) pode vir pronto de quem ja o calculou.
+        """
         step_dia = float(step_dia)
-        base = round(float(entrada) / step_dia) * step_dia
-        alvos: list[float] = []
-
-        if direcao == Direcao.COMPRA:
-            for i in range(1, self.num_alvos + 1):
-                alvo = base + i * step_dia
-                if alvo > entrada:
-                    alvos.append(round(float(alvo), 2))
+        if base is None:
+            base = round(float(entrada) / step_dia) * step_dia
+        passos = range(1, self.num_alvos + 1)
+
+        if direcao is Direcao.COMPRA:
+            alvos = [_q2(float(alvo)) for alvo in (base + i * step_dia for i in passos) if alvo > entrada]
         else:
-            for i in range(1, self.num_alvos + 1):
-                alvo = base - i * step_dia
-                if alvo < entrada:
-                    alvos.append(round(float(alvo), 2))
+            alvos = [_q2(float(alvo)) for alvo in (base - i * step_dia for i in passos) if alvo < entrada]
 
         return alvos[: self.num_alvos]
 
@@ -200,6 +238,44 @@ def _time_in_window(t: time, start: time, end: time) -> bool:
     return t >= start or t <= end
 
 
+# (permitido, janela_label, direcao_esperada)
+_JanelaInfo = tuple[bool, str | None, str | None]
+_Janela = tuple[time, time, str, str]  # (inicio, fim, label, direcao)
+
+
+def _janela_em(agora: time, config: ConfiguracaoOperacional, janelas: tuple[_Janela, ...]) -> _JanelaInfo:
+    if not _time_in_window(agora, config.kill_zone_inicio, config.kill_zone_fim):
+        return False, None, None
+
+    for inicio, fim, label, direcao in janelas:
+        if _time_in_window(agora, inicio, fim):
+            return True, label, direcao
+
+    return True, "OBSERVACAO", "AMBAS"
+
+
+@functools.lru_cache(maxsize=8)
+def _janelas_preparadas(
+    config: ConfiguracaoOperacional,
+) -> tuple[tuple[_Janela, ...], tuple[tuple[_JanelaInfo, ...], tuple[_JanelaInfo, ...]] | None]:
+    """
+    Janelas com label pronto e, se todas as bordas caem em minuto cheio, a tabela minuto-do-dia -> resultado.
+    A tabela tem duas colunas: o instante exato hh:mm:00 (bordas sao inclusivas) e o resto do minuto.
+    """
+    janelas = tuple(
+        (j.inicio, j.fim, f"{j.inicio.strftime('%H:%M')}-{j.fim.strftime('%H:%M')}", j.direcao_esperada)
+        for j in config.janelas_prioritarias
+    )
+    bordas = (config.kill_zone_inicio, config.kill_zone_fim, *(t for j in janelas for t in j[:2]))
+    if any(t.second or t.microsecond for t in bordas):
+        return janelas, None
+
+    minutos = [divmod(m, 60) for m in range(24 * 60)]
+    exato = tuple(_janela_em(time(h, m), config, janelas) for h, m in minutos)
+    resto = tuple(_janela_em(time(h, m, 30), config, janelas) for h, m in minutos)
+    return janelas, (exato, resto)
+
+
 class OperacionalKillZone:
     """
     Motor de regras do operacional (Kill Zone Asiática).
@@ -215,6 +291,10 @@ class OperacionalKillZone:
         )
         self.gerador_alvos = GeradorAlvos(self.config.numero_alvos)
 
+        # Janelas (label pronto) e tabela por minuto do dia, refeitas se self.config for trocado.
+        self._janelas_config = self.config
+        self._janelas, self._tabela_minutos = _janelas_preparadas(self.config)
+
         self._day_key: date | None = None
         self._ops_by_window: dict[str, int] = {}
 
@@ -230,14 +310,15 @@ class OperacionalKillZone:
         """
         Returns (permitido, janela_label, direcao_esperada)
         """
-        if not self.verificar_horario_permitido(agora):
-            return False, None, None
+        if self._janelas_config is not self.config:
+            self._janelas_config = self.config
+            self._janelas, self._tabela_minutos = _janelas_preparadas(self.config)
 
-        for j in self.config.janelas_prioritarias:
-            if _time_in_window(agora, j.inicio, j.fim):
-                return True, f"{j.inicio.strftime('%H:%M')}-{j.fim.strftime('%H:%M')}", j.direcao_esperada
-
-        return True, "OBSERVACAO", "AMBAS"
+        if self._tabela_minutos is None:
+            return _janela_em(agora, self.config, self._janelas)
+        exato, resto = self._tabela_minutos
+        tabela = resto if agora.second or agora.microsecond else exato
+        return tabela[agora.hour * 60 + agora.minute]
 
     def analisar_oportunidade(
         self,
@@ -254,10 +335,10 @@ class OperacionalKillZone:
         Compatível com o uso:
             sinal = op.analisar_oportunidade(preco_atual, candle, contexto)
         """
-        tz = ZoneInfo("Europe/Lisbon")
-        now = datetime.now(tz)
-        agora = agora or now.time()
-        day_key = day_key or now.date()
+        if agora is None or day_key is None:
+            now = datetime.now(_LISBON_TZ)
+            agora = agora or now.time()
+            day_key = day_key or now.date()
 
         permitido, janela_label, janela_dir = self.janela_atual(agora)
         if not permitido:
@@ -283,15 +364,27 @@ class OperacionalKillZone:
             return None
 
         step_eff = float(step_dia) if step_dia and step_dia > 0 else float(niveis[0].step)
+        # Mesma base da grade de niveis; alvos dependem so da direcao, entao saem uma vez por direcao.
+        base = round(float(preco_atual) / step_eff) * step_eff
+        alvos_por_direcao: dict[Direcao, list[float]] = {}
         directions = ("COMPRA", "VENDA") if direcao_esperada == "AMBAS" else (direcao_esperada,)
+        # Candle convertido uma vez, nao a cada nivel x direcao. A forca do pavio so depende do
+        # candle: calcula por direcao uma vez e descarta de saida as direcoes sem rejeicao valida;
+        # por nivel resta apenas o teste de toque.
+        ohlc = candle_para_ohlc(candle)
+        forca_min = float(self.config.forca_rejeicao_min)
+        forcas = {d: self.detector_rejeicao.forca_pavio(ohlc, d) for d in directions}
+        directions = tuple(d for d in directions if forcas[d] and forcas[d] >= forca_min)
+        if not directions:
+            return None
 
         for nivel in niveis[:5]:
             for d in directions:
-                rejeitou, forca = self.detector_rejeicao.detectar_rejeicao(candle, nivel.valor, d)
-                if not rejeitou or forca < float(self.config.forca_rejeicao_min):
+                if not self.detector_rejeicao.tocou_nivel(ohlc, nivel.valor, d):
                     continue
+                forca = forcas[d]
 
-                direcao = Direcao.COMPRA if d == "COMPRA" else Direcao.VENDA
+                direcao = _DIRECAO_POR_NOME[d]
                 stop = CalculadorStopEstrutural.calcular_stop(
                     direcao, float(nivel.valor), contexto, stop_min=float(self.config.stop_minimo)
                 )
@@ -303,13 +396,16 @@ class OperacionalKillZone:
                 if risco > float(self.config.stop_maximo):
                     stop = (
                         float(preco_atual) + float(self.config.stop_maximo)
-                        if direcao == Direcao.VENDA
+                        if direcao is Direcao.VENDA
                         else float(preco_atual) - float(self.config.stop_maximo)
                     )
-                    stop = round(float(stop), 2)
+                    stop = _q2(float(stop))
                     risco = CalculadorStopEstrutural.risco_pontos(float(preco_atual), float(stop))
 
-                alvos = self.gerador_alvos.gerar_alvos(float(preco_atual), direcao, step_eff)
+                alvos = alvos_por_direcao.get(direcao)
+                if alvos is None:
+                    alvos = self.gerador_alvos.gerar_alvos(float(preco_atual), direcao, step_eff, base=base)
+                    alvos_por_direcao[direcao] = alvos
                 if not alvos:
                     continue
 
@@ -318,8 +414,8 @@ class OperacionalKillZone:
 
                 return SinalOperacional(
                     direcao=direcao,
-                    entrada=round(float(preco_atual), 2),
-                    stop=round(float(stop), 2),
+                    entrada=_q2(float(preco_atual)),
+                    stop=_q2(float(stop)),
                     alvos=alvos,
                     nivel_testado=float(nivel.valor),
                     forca_rejeicao=float(forca),
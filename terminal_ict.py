@@ -0,0 +1,606 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import AsyncGenerator, Coroutine, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import streamlit as st
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+    from groq import AsyncGroq, Groq
+
+# groq, httpx, requests and feedparser are imported inside the helpers
+# that use them, so the first page paint does not wait on those imports.
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+# Sidebar themes -> Google News query. Built once per process (read-only), not per rerun.
+TEMAS_FULL: Mapping[str, str] = MappingProxyType({
+    "COT & Institutional Bias": "Commitment of Traders CFTC smart money",
+    "Forex: ICT Majors": "DXY EURUSD price action analysis",
+    "Metais & Liquidez": "Gold Silver liquidity price action",
+    "Indices: S&P500 / Nasdaq (ICT)": "S&P500 Nasdaq price action",
+    "Geopolitica & Macro": "Geopolitics global market news",
+})
+TEMAS_KEYS: tuple[str, ...] = tuple(TEMAS_FULL)
+PERIODOS: tuple[str, ...] = ("12h", "24h", "48h", "7d", "30d")
+
+# Budget (estimated tokens) of raw news sent to the model, applied once by preparar_payload.
+MAX_TEXTO_TOKENS = 1200
+
+# Output budget per call: the column panels are short reads, only the final plan gets the long one.
+MAX_TOKENS_PAINEL = 350
+MAX_TOKENS_PLANO = 1000
+
+# Static part first and byte-identical across every call, so Groq's prefix cache can reuse it;
+# only the role suffix varies per profile. Groq only caches prefixes of ~1024+ tokens, hence the
+# full rubric instead of a one-liner.
+_ICT_CONTEXTO_FIXO = """CONTEXTO ICT FIXO: Utilize estritamente a metodologia ICT (Inner Circle Trader).
+Diferencie fluxo institucional de inducao do varejo. Responda em PORTUGUES tecnico e direto.
+
+RUBRICA DE ANALISE (aplique na ordem, citando apenas o que os dados suportam):
+
+1. Contexto macro e narrativa
+- Identifique o driver dominante (juros/Fed, inflacao, emprego, geopolitica, fluxo de risco).
+- Classifique o ambiente: risk-on, risk-off ou misto. Relacione com DXY, US10Y e ouro quando possivel.
+- Separe fato (dado divulgado, decisao oficial) de expectativa (consenso, rumor, opiniao de analista).
+- Aponte eventos agendados que podem gerar deslocamento (CPI, NFP, FOMC, falas de dirigentes).
+
+2. Estrutura de mercado
+- Defina a tendencia no alto tempo grafico (HTF) antes do baixo (LTF).
+- BOS (break of structure) confirma continuacao; CHoCH (change of character) sinaliza possivel reversao.
+- So considere quebra valida com fechamento de corpo alem do swing, nao apenas pavio.
+- Indique o ultimo swing high e swing low relevantes que a narrativa implica.
+
+3. Liquidez
+- Buy-side liquidity (BSL): acima de maximas anteriores, topos iguais e maximas de sessao.
+- Sell-side liquidity (SSL): abaixo de minimas anteriores, fundos iguais e minimas de sessao.
+- Um movimento que varre liquidez e reverte indica inducao; um movimento que varre e aceita indica continuacao.
+- Aponte qual pool de liquidez e o alvo mais provavel (draw on liquidity) e por que.
+
+4. Zonas de interesse (PD arrays)
+- Order block: ultimo candle contrario antes do deslocamento que quebrou estrutura.
+- Fair value gap (FVG): desequilibrio de tres candles; espere reacao no preenchimento parcial (consequent encroachment).
+- Breaker e mitigation block: order blocks que falharam e passam a atuar como suporte/resistencia invertida.
+- Premium/discount: compre em discount (abaixo de 50% do range) e venda em premium (acima de 50%), alinhado ao vies.
+
+5. Tempo e sessoes
+- Kill zones: Asia (acumulacao), Londres (manipulacao frequente da maxima/minima da Asia), Nova York (distribuicao/continuacao).
+- Power of three: acumulacao, manipulacao e distribuicao dentro do dia.
+- Evite conclusoes de entrada fora das kill zones sem justificativa.
+
+6. Comportamento do varejo
+- Identifique onde o varejo provavelmente esta posicionado (rompimentos obvios, suportes/resistencias classicos, manchetes alarmistas).
+- Descreva a armadilha: onde ficam os stops do varejo e como o movimento institucional os usa como liquidez.
+
+7. Gestao de risco
+- Toda ideia precisa de invalidacao clara (nivel que anula a tese).
+- Prefira alvos em pools de liquidez opostos; relacao risco/retorno minima de 1:2.
+- Se os dados forem insuficientes ou contraditorios, declare o vies como neutro e diga o que falta.
+
+8. Correlacoes e confirmacao (SMT)
+- Compare ativos correlacionados (EURUSD x GBPUSD, ouro x prata, S&P500 x Nasdaq, DXY x majors).
+- Divergencia SMT: um ativo faz nova maxima/minima e o correlacionado nao; reforca reversao na zona de interesse.
+- Sem confirmacao intermercado, reduza a conviccao da tese.
+
+FORMATO
+- Seja objetivo: topicos curtos, sem repetir os dados de entrada.
+- Nao invente precos, datas ou noticias que nao estejam nos dados.
+- Nao e recomendacao financeira; trate como analise educacional."""
+_ICT_SYSTEM_TEMPLATE = _ICT_CONTEXTO_FIXO + "\n\nPAPEL ATUAL: Voce e um {perfil} especializado em ICT."
+
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def _lookup_secret(name: str) -> str:
+    # Prefer Streamlit secrets, fallback to environment variables.
+    # Raises KeyError when missing: st.cache_resource does not cache exceptions, so only hits stick.
+    try:
+        if name in st.secrets:
+            val = st.secrets[name]
+            if isinstance(val, str) and val.strip():
+                return val.strip()
+    except Exception:
+        pass
+
+    val = os.environ.get(name)
+    if isinstance(val, str) and val.strip():
+        return val.strip()
+    raise KeyError(name)
+
+
+def get_secret(name: str) -> str | None:
+    try:
+        return _lookup_secret(name)
+    except KeyError:
+        return None
+
+
+def render_private_unlock_sidebar() -> None:
+    st.sidebar.divider()
+    st.sidebar.subheader("Private")
+
+    if st.session_state.get("private_unlocked"):
+        st.sidebar.success("Unlocked")
+        if st.sidebar.button("Logout"):
+            st.session_state["private_unlocked"] = False
+        return
+
+    password = st.sidebar.text_input("Password", type="password")
+    if st.sidebar.button("Unlock"):
+        expected = get_secret("PRIVATE_PASSWORD")
+        if not expected:
+            st.sidebar.error("Missing PRIVATE_PASSWORD in secrets/env.")
+            return
+        if hmac.compare_digest(password or "", expected):
+            st.session_state["private_unlocked"] = True
+            st.sidebar.success("Unlocked")
+        else:
+            st.sidebar.error("Invalid password.")
+
+
+def _registrar_uso_cache(usage: Any) -> None:
+    # Groq reports prefix-cache hits as usage.prompt_tokens_details.cached_tokens.
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    if prompt:
+        logger.info("groq prompt cache: %d/%d tokens (%.0f%%)", cached, prompt, 100.0 * cached / prompt)
+
+
+@functools.lru_cache(maxsize=1)
+def _resolve_groq_key() -> str:
+    # Raise instead of returning None so a missing key never ends up inside a cached client/result.
+    # Memoized for the process: every completion (and worker thread) skips the st.secrets/env lookup.
+    # lru_cache does not memoize exceptions, so a missing key is re-checked on the next call.
+    key = get_secret("GROQ_API_KEY")
+    if not key:
+        raise RuntimeError("GROQ_API_KEY nao configurada (secrets/env).")
+    return key
+
+
+def _groq_timeout() -> httpx.Timeout:
+    # Split budget: a stuck connect fails fast instead of eating the generation (read) time.
+    import httpx
+
+    return httpx.Timeout(connect=3.0, read=30.0, write=5.0, pool=2.0)
+
+
+@functools.lru_cache(maxsize=1)
+def _groq_http2() -> bool:
+    # HTTP/2 lets the parallel profile calls multiplex over one TLS connection. httpx needs the
+    # optional `h2` package for it (httpx[http2]); without it we stay on HTTP/1.1 pooling.
+    import importlib.util
+
+    return importlib.util.find_spec("h2") is not None
+
+
+def _groq_limits() -> httpx.Limits:
+    import httpx
+
+    return httpx.Limits(max_connections=20, max_keepalive_connections=10)
+
+
+@st.cache_resource(show_spinner=False)
+def get_groq_client(api_key: str) -> Groq:
+    # One client per key so the httpx pool (and its TLS sessions) survives reruns.
+    import httpx
+    from groq import Groq
+
+    http_client = httpx.Client(timeout=_groq_timeout(), limits=_groq_limits(), http2=_groq_http2())
+    return Groq(api_key=api_key, http_client=http_client)
+
+
+@st.cache_resource(show_spinner=False)
+def _async_loop() -> asyncio.AbstractEventLoop:
+    # A single long-lived loop (daemon thread): the AsyncGroq httpx pool is bound to it,
+    # so it must outlive each call and each Streamlit rerun.
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="groq-async-loop", daemon=True).start()
+    return loop
+
+
+def _run_async(coro: Coroutine[Any, Any, T]) -> T:
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop()).result()
+
+
+def _iter_async(agen: AsyncGenerator[T, None]) -> Iterator[T]:
+    # Drive an async generator on the shared loop from sync code, one item at a time.
+    # A consumer that stops early (st.write_stream cut by a rerun/stop) still closes it.
+    async def _next() -> T:
+        return await agen.__anext__()
+
+    try:
+        while True:
+            try:
+                yield _run_async(_next())
+            except StopAsyncIteration:
+                return
+    finally:
+        _run_async(agen.aclose())
+
+
+@st.cache_resource(show_spinner=False)
+def get_async_groq_client(api_key: str) -> AsyncGroq:
+    import httpx
+    from groq import AsyncGroq
+
+    http_client = httpx.AsyncClient(timeout=_groq_timeout(), limits=_groq_limits(), http2=_groq_http2())
+    return AsyncGroq(api_key=api_key, http_client=http_client)
+
+
+async def _aquecer_groq(api_key: str) -> None:
+    # models.list is a free metadata call; it only exists to open DNS/TLS on both pools.
+    try:
+        await asyncio.gather(
+            get_async_groq_client(api_key).models.list(),
+            asyncio.to_thread(get_groq_client(api_key).models.list),
+        )
+    except Exception as e:
+        logger.info("groq warmup falhou: %s", e)
+
+
+@st.cache_resource(show_spinner=False)
+def aquecer_conexoes_groq() -> None:
+    """
+    Abre as conexoes com a Groq em segundo plano no boot, para o primeiro clique nao pagar o handshake.
+    Nao bloqueia a pagina; sem GROQ_API_KEY levanta (e nao fica em cache), entao o app tenta de novo depois.
+    """
+    asyncio.run_coroutine_threadsafe(_aquecer_groq(_resolve_groq_key()), _async_loop())
+
+
+@functools.lru_cache(maxsize=32)
+def _build_system(perfil: str) -> str:
+    system = _ICT_SYSTEM_TEMPLATE.format(perfil=perfil)
+    if perfil != PERFIL_GESTOR:
+        system += "\nSeja conciso: no maximo 5 topicos curtos."
+    return system
+
+
+def _max_tokens(perfil: str) -> int:
+    return MAX_TOKENS_PLANO if perfil == PERFIL_GESTOR else MAX_TOKENS_PAINEL
+
+
+# Prefixes of the placeholder texts the chamar_ia_groq* helpers return instead of raising.
+_PREFIXOS_FALHA = ("Erro na consulta", "A IA nao retornou")
+
+
+def resposta_ok(resposta: str) -> bool:
+    return not resposta.startswith(_PREFIXOS_FALHA)
+
+
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?])\s+")
+
+
+def resumir_resposta(texto: str, max_chars: int = 800) -> str:
+    """
+    Corta uma resposta em limite de frase, sem passar de `max_chars`.
+    Usado para limitar o contexto da sintese final (menos prefill, sem corte no meio da frase).
+    """
+    texto = (texto or "").strip()
+    if len(texto) <= max_chars:
+        return texto
+
+    partes: list[str] = []
+    total = 0
+    for frase in _FIM_DE_FRASE.split(texto):
+        if total + len(frase) + 1 > max_chars:
+            break
+        partes.append(frase)
+        total += len(frase) + 1
+    return " ".join(partes) if partes else texto[:max_chars]
+
+
+_ESPACOS = re.compile(r"[ \t]+")
+_SEPARADORES_REPETIDOS = re.compile(r"(?:---\n){2,}")
+# Word runs and single punctuation marks: close to the tokenizer count for English headlines,
+# without shipping a tokenizer.
+_TOKEN_APROX = re.compile(r"\w+|[^\w\s]")
+
+
+def preparar_payload(texto: str) -> str:
+    """
+    Normaliza e corta o texto bruto uma unica vez antes das consultas: colapsa espacos,
+    remove linhas vazias e separadores `---` repetidos e limita a MAX_TEXTO_TOKENS (estimados).
+    O corte cai no fim de uma linha completa, nunca no meio de uma manchete.
+    O mesmo payload (byte a byte) e enviado a todos os perfis, o que ajuda o cache do provedor.
+    As funcoes `chamar_ia_groq*` esperam receber o texto ja preparado.
+    """
+    linhas = (_ESPACOS.sub(" ", linha).strip() for linha in (texto or "").splitlines())
+    normalizado = "\n".join(linha for linha in linhas if linha) + "\n"
+    payload = _SEPARADORES_REPETIDOS.sub("---\n", normalizado).strip()
+
+    tokens = 0
+    for tokens, m in enumerate(_TOKEN_APROX.finditer(payload), start=1):
+        if tokens > MAX_TEXTO_TOKENS:
+            corte = payload.rfind("\n", 0, m.start())
+            payload = payload[: corte if corte > 0 else m.start()].rstrip()
+            tokens = len(_TOKEN_APROX.findall(payload))
+            break
+    logger.info("payload: ~%d tokens, %d chars", tokens, len(payload))
+    return payload
+
+
+def _mensagens_ict(perfil: str, payload: str) -> list[dict[str, str]]:
+    return [
+        {"role": "system", "content": _build_system(perfil)},
+        {"role": "user", "content": f"Analise estes dados sob a otica ICT:\n\n{payload}"},
+    ]
+
+
+# Modos de consulta expostos no sidebar.
+MODO_PARALELO = "Paralelo (streaming)"
+MODO_JSON_ANALISTAS = "Analistas em JSON + plano streaming"
+MODO_CHAMADA_UNICA = "Chamada unica (JSON)"
+MODO_BATCH = "Batch economico"
+
+PERFIS_ANALISTAS: tuple[str, ...] = (
+    "Especialista em Smart Money ICT",
+    "Analista de Inducao de Varejo",
+    "Estrategista Macro",
+)
+PERFIL_GESTOR = "Gestor ICT Senior"
+
+
+def _mensagens_json(perfis: tuple[str, ...], payload: str) -> list[dict[str, str]]:
+    secoes = "\n".join(f'- "p{i}": analise como {perfil}' for i, perfil in enumerate(perfis, start=1))
+    papel = (
+        "\n\nPAPEL ATUAL: Voce e um painel ICT com varios perfis. Responda APENAS JSON valido com "
+        "exatamente as chaves abaixo, preenchidas em ordem (cada secao pode usar as anteriores):\n" + secoes
+    )
+    return [
+        {"role": "system", "content": _ICT_CONTEXTO_FIXO + papel},
+        {"role": "user", "content": f"DADOS:\n{payload}\n\nGERE AS {len(perfis)} SECOES."},
+    ]
+
+
+def hash_payload(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_COMPLETION_TTL_S = 3600
+
+
+# Completions are content-addressed (model, perfil, sha256(payload)) and kept in memory for an
+# hour, so a repeated "Executar" on the same data survives reruns; after the TTL a fresh answer is
+# generated. `_payload` is excluded from Streamlit's key (leading underscore).
+@st.cache_data(ttl=_COMPLETION_TTL_S, max_entries=256, show_spinner=False)
+def _groq_json(perfis: tuple[str, ...], payload_hash: str, model: str, _payload: str) -> tuple[str, ...]:
+    # One prefill of the news blob for every profile; errors raise so they are never cached.
+    completion = get_groq_client(_resolve_groq_key()).chat.completions.create(
+        model=model,
+        messages=_mensagens_json(perfis, _payload),
+        temperature=0.3,
+        max_tokens=sum(map(_max_tokens, perfis)),
+        response_format={"type": "json_object"},
+    )
+    _registrar_uso_cache(completion.usage)
+    if not completion.choices:
+        raise RuntimeError("A IA nao retornou resposta.")
+    data = json.loads(completion.choices[0].message.content or "{}")
+    if not isinstance(data, dict):
+        raise RuntimeError("resposta JSON fora do formato esperado.")
+    return tuple(
+        str(data.get(f"p{i}") or "").strip() or "A IA nao retornou esta secao." for i in range(1, len(perfis) + 1)
+    )
+
+
+def chamar_ia_groq_json(perfis: list[str], payload: str, model: str = "llama-3.1-8b-instant") -> list[str]:
+    """
+    Gera a analise de todos os perfis numa unica requisicao em modo JSON (um unico prefill dos dados).
+    Retorna as respostas na mesma ordem de `perfis`; em caso de erro, todas recebem a mensagem de erro.
+    """
+    try:
+        return list(_groq_json(tuple(perfis), hash_payload(payload), model, payload))
+    except Exception as e:
+        return [f"Erro na consulta ({perfil}): {str(e)}" for perfil in perfis]
+
+
+@st.cache_data(ttl=_COMPLETION_TTL_S, max_entries=256, show_spinner=False)
+def _groq_completion(perfil: str, payload_hash: str, model: str, _payload: str) -> str:
+    # Errors raise so they are never cached.
+    client = get_async_groq_client(_resolve_groq_key())
+    return _run_async(_chamar_ia_groq_async(client, perfil, _payload, model))
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_completion(perfil: str, payload: str, model: str, janela: int) -> str:
+    # In-process front for _groq_completion: a hit skips st.cache_data's pickle round-trip.
+    # `janela` (time // TTL) expires the entry with the cache below instead of pinning it.
+    # Exceptions are not memoized by lru_cache, so failed calls are retried next time.
+    return _groq_completion(perfil, hash_payload(payload), model, payload)
+
+
+def chamar_ia_groq(perfil: str, payload: str, model: str = "llama-3.1-8b-instant") -> str:
+    try:
+        return _cached_completion(perfil, payload, model, int(time.time() // _COMPLETION_TTL_S))
+    except Exception as e:
+        return f"Erro na consulta ({perfil}): {str(e)}"
+
+
+def chamar_ia_groq_stream(perfil: str, payload: str, model: str = "llama-3.1-8b-instant") -> Iterator[str]:
+    # Same prompt as chamar_ia_groq, but yields tokens as they arrive (not cached).
+    # Runs on the same AsyncGroq pool as the analyst calls, so the synthesis reuses their connection.
+    try:
+        client = get_async_groq_client(_resolve_groq_key())
+        yield from _iter_async(_stream_ia_groq_async(client, perfil, payload, model))
+    except Exception as e:
+        yield f"Erro na consulta ({perfil}): {str(e)}"
+
+
+async def _chamar_ia_groq_async(
+    client: AsyncGroq, perfil: str, payload: str, model: str = "llama-3.1-8b-instant"
+) -> str:
+    completion = await client.chat.completions.create(
+        model=model,
+        messages=_mensagens_ict(perfil, payload),
+        temperature=0.3,
+        max_tokens=_max_tokens(perfil),
+    )
+    _registrar_uso_cache(completion.usage)
+    if not completion.choices:
+        raise RuntimeError("A IA nao retornou resposta.")
+    return completion.choices[0].message.content
+
+
+async def _stream_ia_groq_async(
+    client: AsyncGroq, perfil: str, payload: str, model: str = "llama-3.1-8b-instant"
+) -> AsyncGenerator[str, None]:
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=_mensagens_ict(perfil, payload),
+        temperature=0.3,
+        max_tokens=_max_tokens(perfil),
+        stream=True,
+    )
+    async with stream:  # closes the HTTP response when the generator is closed early
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+
+
+def chamar_ia_groq_paralelo(perfis: list[str], payload: str) -> list[str]:
+    """
+    Dispara as consultas dos perfis em paralelo (AsyncGroq compartilhado, pool httpx persistente).
+    Retorna as respostas na mesma ordem de `perfis`; erros viram mensagem por perfil.
+    Respostas repetidas para o mesmo payload saem do cache em memoria.
+    """
+    # One thread per profile so each goes through the cached chamar_ia_groq path; the
+    # completions themselves still run concurrently on the shared AsyncGroq loop. The workers
+    # carry this run's ScriptRunContext, which the st.cache_data layer expects to find.
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, len(perfis)),
+        thread_name_prefix="groq-perfil",
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx()),
+    ) as ex:
+        return list(ex.map(lambda perfil: chamar_ia_groq(perfil, payload), perfis))
+
+
+def enviar_ia_groq_batch(perfis: list[str], payload: str) -> str:
+    """
+    Modo economico: envia os perfis como um unico job da Groq Batch API e retorna o id do batch.
+    Mais barato que chamadas diretas, mas a latencia e imprevisivel (janela de ate 24h);
+    o resultado e lido depois com consultar_ia_groq_batch. Erros de envio sobem ao chamador.
+    """
+    client = get_groq_client(_resolve_groq_key())
+    jsonl = "\n".join(
+        json.dumps(
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": "llama-3.1-8b-instant",
+                    "messages": _mensagens_ict(perfil, payload),
+                    "temperature": 0.3,
+                    "max_tokens": _max_tokens(perfil),
+                },
+            }
+        )
+        for i, perfil in enumerate(perfis)
+    )
+    upload = client.files.create(file=("ict_batch.jsonl", jsonl.encode("utf-8")), purpose="batch")
+    batch = client.batches.create(
+        completion_window="24h",
+        endpoint="/v1/chat/completions",
+        input_file_id=upload.id,
+    )
+    return batch.id
+
+
+def consultar_ia_groq_batch(batch_id: str, perfis: list[str]) -> list[str] | None:
+    """
+    Uma consulta (sem espera) ao batch enviado por enviar_ia_groq_batch.
+    Retorna None enquanto o batch nao terminou; depois, as respostas na mesma ordem de `perfis`
+    (batch com falha/expirado vira mensagem de erro por perfil). Erros de rede sobem ao chamador.
+    """
+    client = get_groq_client(_resolve_groq_key())
+    batch = client.batches.retrieve(batch_id)
+    if batch.status not in ("completed", "failed", "expired", "cancelled"):
+        return None
+    if batch.status != "completed" or not batch.output_file_id:
+        return [f"Erro na consulta ({perfil}): batch {batch_id} terminou com status '{batch.status}'" for perfil in perfis]
+
+    by_id: dict[str, str] = {}
+    for line in client.files.content(batch.output_file_id).text().splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        body = ((item.get("response") or {}).get("body")) or {}
+        choices = body.get("choices") or []
+        content = ((choices[0] or {}).get("message") or {}).get("content") if choices else None
+        by_id[str(item.get("custom_id"))] = content if isinstance(content, str) else "A IA nao retornou resposta."
+
+    return [by_id.get(str(i), f"Erro na consulta ({perfil}): sem resultado no batch.") for i, perfil in enumerate(perfis)]
+
+
+_NEWS_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0 Safari/537.36"
+)
+
+
+@st.cache_resource(show_spinner=False)
+def _news_session() -> requests.Session:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=1))
+    return session
+
+
+_GOOGLE_NEWS_RSS = "https://news.google.com/rss/search?q={q}%20when%3A{period}&hl=en&gl=US&ceid=US:en"
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_news(query: str, period: str, max_results: int = 10) -> list[dict[str, str]]:
+    # Google News RSS read directly: one pooled GET + feedparser. GNews added an HTML parse of every
+    # description and a redirect resolve per article link, none of which the terminal uses.
+    # Only the fields the terminal uses are kept, so the cached payload stays small.
+    import feedparser
+    from urllib.parse import quote
+
+    url = _GOOGLE_NEWS_RSS.format(q=quote(query), period=quote(period))
+    resp = _news_session().get(url, headers={"User-Agent": _NEWS_USER_AGENT}, timeout=15)
+    resp.raise_for_status()
+    return [
+        {"fonte": str((e.get("source") or {}).get("title") or ""), "titulo": str(e.get("title") or "")}
+        for e in feedparser.parse(resp.content).entries[:max_results]
+    ]
+
+
+def sincronizar_tema(tema: str, period: str) -> list[dict[str, str]]:
+    # Errors propagate to the sync fragment, which shows them like the original st.error.
+    return fetch_news(TEMAS_FULL[tema], period)
+
+
+@st.cache_resource(show_spinner=False)
+def news_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="news-sync")
+
+
+def formatar_noticias(news: list[dict[str, str]]) -> str:
+    # One join over a prebuilt list: no per-item string concatenation, no generator for join to drain.
+    if not news:
+        return ""
+    partes = [f"FONTE: {n['fonte']} | INFO: {n['titulo']}" for n in news]
+    return "\n---\n".join(partes) + "\n---\n"
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import hashlib
 import sqlite3
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Iterable, Iterator
 
 import xau_asia_db
 
 
+@dataclass(frozen=True)
+class ImageMeta:
+    rowid: int
+    mime: str | None
+    name: str | None
+    size: int
+
+
 @dataclass(frozen=True)
 class TradeSample:
     trade_id: str
@@ -35,10 +44,40 @@ class TradeSample:
     created_at: str
 
 
-def connect() -> sqlite3.Connection:
-    # Reuse the same data/ folder as xau_asia_db
-    conn = sqlite3.connect(xau_asia_db.db_path())
+# Columns added after the first schema: name -> type, applied by _init_db when missing.
+_MIGRATED_COLUMNS: dict[str, str] = {
+    "psych_step": "REAL",
+    "psych_level": "REAL",
+    "level_type": "TEXT",
+    "touched_level": "INTEGER",
+    "rejection": "INTEGER",
+    "confirmation": "INTEGER",
+    "image_name": "TEXT",
+    "image_mime": "TEXT",
+    "image_blob": "BLOB",
+    "image_sha": "TEXT",
+    # Lisbon hour straight from the isoformat() text, so hour filters run in SQL (see iter_trade_samples).
+    "hour_lisbon": "INTEGER GENERATED ALWAYS AS (CAST(substr(dt_lisbon, 12, 2) AS INTEGER)) VIRTUAL",
+}
+
+def db_path() -> Path:
+    # Reuse the same data/ folder (and file) as xau_asia_db
+    return xau_asia_db.db_path()
+
+
+def connect(*, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    check_same_thread=False is for a connection kept across Streamlit reruns (each rerun runs on
+    a new script thread); the caller must still use it from one thread at a time.
+    """
+    conn = sqlite3.connect(str(db_path()), check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    # WAL lets reads (fetch_all) run alongside a writer; NORMAL sync is safe under WAL.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    # Checked on every connect (cheap IF NOT EXISTS): a deleted/replaced DB file gets its tables back.
     _init_db(conn)
     return conn
 
@@ -68,120 +107,188 @@ def _init_db(conn: sqlite3.Connection) -> None:
             image_name TEXT,
             image_mime TEXT,
             image_blob BLOB,
-            created_at TEXT DEFAULT (datetime('now'))
+            image_sha TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            hour_lisbon INTEGER GENERATED ALWAYS AS (CAST(substr(dt_lisbon, 12, 2) AS INTEGER)) VIRTUAL
         )
         """
     )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_trade_samples_dt_utc ON trade_samples(dt_utc)")
-    # Lightweight migrations for older DBs.
-    cols = {r["name"] for r in conn.execute("PRAGMA table_info(trade_samples)").fetchall()}
-    if "psych_step" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN psych_step REAL")
-    if "psych_level" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN psych_level REAL")
-    if "level_type" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN level_type TEXT")
-    if "touched_level" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN touched_level INTEGER")
-    if "rejection" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN rejection INTEGER")
-    if "confirmation" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN confirmation INTEGER")
-    if "image_name" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN image_name TEXT")
-    if "image_mime" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN image_mime TEXT")
-    if "image_blob" not in cols:
-        conn.execute("ALTER TABLE trade_samples ADD COLUMN image_blob BLOB")
+    # Lightweight migrations for older DBs: one introspection, ALTER only what is missing.
+    cols = {r["name"] for r in conn.execute("PRAGMA table_xinfo(trade_samples)").fetchall()}
+    for name, sql_type in _MIGRATED_COLUMNS.items():
+        if name not in cols:
+            conn.execute(f"ALTER TABLE trade_samples ADD COLUMN {name} {sql_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trade_samples_hour ON trade_samples(hour_lisbon)")
     conn.commit()
 
 
+# image_blob is only bound when the print actually changed (see upsert_trade_samples); a NULL keeps the
+# stored one. The WHERE guard turns a resubmit with nothing changed into a no-op instead of a row rewrite.
+_UPSERT_TRADE_SAMPLES = """
+    INSERT INTO trade_samples (
+        trade_id, symbol, timeframe_min, dt_lisbon, dt_utc, direction,
+        psych_step, psych_level, level_type, touched_level, rejection, confirmation,
+        entry, sl, tp, atr14, result_r, notes,
+        image_name, image_mime, image_blob, image_sha
+    ) VALUES (
+        :trade_id, :symbol, :timeframe_min, :dt_lisbon, :dt_utc, :direction,
+        :psych_step, :psych_level, :level_type, :touched_level, :rejection, :confirmation,
+        :entry, :sl, :tp, :atr14, :result_r, :notes,
+        :image_name, :image_mime, :image_blob, :image_sha
+    )
+    ON CONFLICT(trade_id) DO UPDATE SET
+        symbol=excluded.symbol,
+        timeframe_min=excluded.timeframe_min,
+        dt_lisbon=excluded.dt_lisbon,
+        dt_utc=excluded.dt_utc,
+        direction=excluded.direction,
+        psych_step=excluded.psych_step,
+        psych_level=excluded.psych_level,
+        level_type=excluded.level_type,
+        touched_level=excluded.touched_level,
+        rejection=excluded.rejection,
+        confirmation=excluded.confirmation,
+        entry=excluded.entry,
+        sl=excluded.sl,
+        tp=excluded.tp,
+        atr14=excluded.atr14,
+        result_r=excluded.result_r,
+        notes=excluded.notes,
+        image_name=COALESCE(excluded.image_name, trade_samples.image_name),
+        image_mime=COALESCE(excluded.image_mime, trade_samples.image_mime),
+        image_blob=COALESCE(excluded.image_blob, trade_samples.image_blob),
+        image_sha=COALESCE(excluded.image_sha, trade_samples.image_sha)
+    WHERE trade_samples.symbol IS NOT excluded.symbol
+        OR trade_samples.timeframe_min IS NOT excluded.timeframe_min
+        OR trade_samples.dt_lisbon IS NOT excluded.dt_lisbon
+        OR trade_samples.dt_utc IS NOT excluded.dt_utc
+        OR trade_samples.direction IS NOT excluded.direction
+        OR trade_samples.psych_step IS NOT excluded.psych_step
+        OR trade_samples.psych_level IS NOT excluded.psych_level
+        OR trade_samples.level_type IS NOT excluded.level_type
+        OR trade_samples.touched_level IS NOT excluded.touched_level
+        OR trade_samples.rejection IS NOT excluded.rejection
+        OR trade_samples.confirmation IS NOT excluded.confirmation
+        OR trade_samples.entry IS NOT excluded.entry
+        OR trade_samples.sl IS NOT excluded.sl
+        OR trade_samples.tp IS NOT excluded.tp
+        OR trade_samples.atr14 IS NOT excluded.atr14
+        OR trade_samples.result_r IS NOT excluded.result_r
+        OR trade_samples.notes IS NOT excluded.notes
+        OR excluded.image_blob IS NOT NULL
+        OR COALESCE(excluded.image_name, trade_samples.image_name) IS NOT trade_samples.image_name
+        OR COALESCE(excluded.image_mime, trade_samples.image_mime) IS NOT trade_samples.image_mime
+"""
+
+
+def _image_sha(blob: bytes | None) -> str | None:
+    return hashlib.blake2b(blob, digest_size=16).hexdigest() if blob is not None else None
+
+
+# Bound on host parameters per IN (...) lookup (older SQLite builds cap a statement at 999).
+_IN_CHUNK = 900
+
+
 def upsert_trade_samples(conn: sqlite3.Connection, rows: Iterable[dict[str, Any]]) -> int:
-    sql = """
-        INSERT INTO trade_samples (
-            trade_id, symbol, timeframe_min, dt_lisbon, dt_utc, direction,
-            psych_step, psych_level, level_type, touched_level, rejection, confirmation,
-            entry, sl, tp, atr14, result_r, notes,
-            image_name, image_mime, image_blob
-        ) VALUES (
-            :trade_id, :symbol, :timeframe_min, :dt_lisbon, :dt_utc, :direction,
-            :psych_step, :psych_level, :level_type, :touched_level, :rejection, :confirmation,
-            :entry, :sl, :tp, :atr14, :result_r, :notes,
-            :image_name, :image_mime, :image_blob
-        )
-        ON CONFLICT(trade_id) DO UPDATE SET
-            symbol=excluded.symbol,
-            timeframe_min=excluded.timeframe_min,
-            dt_lisbon=excluded.dt_lisbon,
-            dt_utc=excluded.dt_utc,
-            direction=excluded.direction,
-            psych_step=excluded.psych_step,
-            psych_level=excluded.psych_level,
-            level_type=excluded.level_type,
-            touched_level=excluded.touched_level,
-            rejection=excluded.rejection,
-            confirmation=excluded.confirmation,
-            entry=excluded.entry,
-            sl=excluded.sl,
-            tp=excluded.tp,
-            atr14=excluded.atr14,
-            result_r=excluded.result_r,
-            notes=excluded.notes,
-            image_name=COALESCE(excluded.image_name, trade_samples.image_name),
-            image_mime=COALESCE(excluded.image_mime, trade_samples.image_mime),
-            image_blob=COALESCE(excluded.image_blob, trade_samples.image_blob)
-    """
-    cur = conn.cursor()
-    count = 0
-    for row in rows:
-        cur.execute(sql, row)
-        count += 1
+    rows_list = [dict(r) for r in rows]  # copies: the fields set below never touch the caller's dicts
+    if not rows_list:
+        return 0
+    # One statement prepared once and one transaction (single fsync) for the whole batch.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Hash each upload once, then read the stored shas for the whole batch in one query;
+        # re-sending the stored print (e.g. editing only the notes) drops the blob parameter so
+        # the multi-MB value is neither bound nor rewritten.
+        for row in rows_list:
+            row["image_sha"] = _image_sha(row.get("image_blob"))
+        ids = [row["trade_id"] for row in rows_list if row["image_sha"] is not None]
+        stored: dict[str, str | None] = {}
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i : i + _IN_CHUNK]
+            stored.update(
+                conn.execute(
+                    f"SELECT trade_id, image_sha FROM trade_samples WHERE trade_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        for row in rows_list:
+            if row["image_sha"] is not None and stored.get(row["trade_id"]) == row["image_sha"]:
+                row["image_blob"] = None
+                row["image_sha"] = None
+        conn.executemany(_UPSERT_TRADE_SAMPLES, rows_list)
+    except Exception:
+        conn.rollback()
+        raise
     conn.commit()
-    return count
+    return len(rows_list)
 
 
-def fetch_all(conn: sqlite3.Connection) -> list[TradeSample]:
-    cur = conn.execute(
-        """
-        SELECT
-            trade_id, symbol, timeframe_min, dt_lisbon, dt_utc, direction,
-            psych_step, psych_level, level_type, touched_level, rejection, confirmation,
-            entry, sl, tp, atr14, result_r, notes, created_at,
-            image_name, image_mime,
-            (image_blob IS NOT NULL) AS has_image
-        FROM trade_samples
-        ORDER BY dt_utc ASC
-        """
-    )
-    out: list[TradeSample] = []
-    for r in cur.fetchall():
-        out.append(
-            TradeSample(
-                trade_id=str(r["trade_id"]),
-                symbol=str(r["symbol"]),
-                timeframe_min=int(r["timeframe_min"]),
-                dt_lisbon=str(r["dt_lisbon"]),
-                dt_utc=str(r["dt_utc"]),
-                direction=str(r["direction"]),
-                psych_step=float(r["psych_step"]) if r["psych_step"] is not None else None,
-                psych_level=float(r["psych_level"]) if r["psych_level"] is not None else None,
-                level_type=str(r["level_type"]) if r["level_type"] is not None else None,
-                touched_level=bool(int(r["touched_level"])) if r["touched_level"] is not None else None,
-                rejection=bool(int(r["rejection"])) if r["rejection"] is not None else None,
-                confirmation=bool(int(r["confirmation"])) if r["confirmation"] is not None else None,
-                entry=float(r["entry"]),
-                sl=float(r["sl"]),
-                tp=float(r["tp"]),
-                atr14=float(r["atr14"]) if r["atr14"] is not None else None,
-                result_r=float(r["result_r"]) if r["result_r"] is not None else None,
-                notes=str(r["notes"]) if r["notes"] is not None else None,
-                image_name=str(r["image_name"]) if r["image_name"] is not None else None,
-                image_mime=str(r["image_mime"]) if r["image_mime"] is not None else None,
-                has_image=bool(int(r["has_image"])),
-                created_at=str(r["created_at"]),
-            )
+_SELECT_TRADES = """
+    SELECT
+        trade_id, symbol, timeframe_min, dt_lisbon, dt_utc, direction,
+        psych_step, psych_level, level_type, touched_level, rejection, confirmation,
+        entry, sl, tp, atr14, result_r, notes, created_at,
+        image_name, image_mime,
+        (image_blob IS NOT NULL) AS has_image
+    FROM trade_samples
+    {where}
+    ORDER BY dt_utc ASC
+"""
+
+
+def _flag(v: int | None) -> bool | None:
+    return None if v is None else v != 0
+
+
+def iter_trade_samples(conn: sqlite3.Connection, hours: Iterable[int] | None = None) -> Iterator[TradeSample]:
+    """
+    hours: keep only trades whose Lisbon hour (hour_lisbon column) is in this set; None = all trades.
+    """
+    # Plain tuples (no sqlite3.Row) and no re-casting: the column affinities already return
+    # int/float/str, only the 0/1 flags need turning into bool.
+    params: tuple[int, ...] = ()
+    where = ""
+    if hours is not None:
+        params = tuple(sorted({int(h) for h in hours}))
+        where = f"WHERE hour_lisbon IN ({', '.join('?' * len(params))})"
+    cur = conn.cursor()
+    cur.row_factory = None
+    for (
+        trade_id, symbol, timeframe_min, dt_lisbon, dt_utc, direction,
+        psych_step, psych_level, level_type, touched_level, rejection, confirmation,
+        entry, sl, tp, atr14, result_r, notes, created_at,
+        image_name, image_mime, has_image,
+    ) in cur.execute(_SELECT_TRADES.format(where=where), params):
+        yield TradeSample(
+            trade_id=trade_id,
+            symbol=symbol,
+            timeframe_min=timeframe_min,
+            dt_lisbon=dt_lisbon,
+            dt_utc=dt_utc,
+            direction=direction,
+            psych_step=psych_step,
+            psych_level=psych_level,
+            level_type=level_type,
+            touched_level=_flag(touched_level),
+            rejection=_flag(rejection),
+            confirmation=_flag(confirmation),
+            entry=entry,
+            sl=sl,
+            tp=tp,
+            atr14=atr14,
+            result_r=result_r,
+            notes=notes,
+            image_name=image_name,
+            image_mime=image_mime,
+            has_image=has_image != 0,
+            created_at=created_at,
         )
-    return out
+
+
+def fetch_all(conn: sqlite3.Connection, hours: Iterable[int] | None = None) -> list[TradeSample]:
+    return list(iter_trade_samples(conn, hours))
 
 
 def count(conn: sqlite3.Connection) -> int:
@@ -200,6 +307,29 @@ def fetch_image(conn: sqlite3.Connection, trade_id: str) -> tuple[bytes | None,
     return (bytes(blob) if blob is not None else None), row["image_mime"], row["image_name"]
 
 
+def fetch_image_meta(conn: sqlite3.Connection, trade_id: str) -> ImageMeta | None:
+    """
+    Metadata of the stored print without pulling the blob bytes into Python.
+    Returns None when the trade does not exist or has no image.
+    """
+    row = conn.execute(
+        "SELECT rowid, image_mime, image_name, length(image_blob) AS size FROM trade_samples "
+        "WHERE trade_id = ? AND image_blob IS NOT NULL",
+        (trade_id,),
+    ).fetchone()
+    if not row:
+        return None
+    return ImageMeta(rowid=row["rowid"], mime=row["image_mime"], name=row["image_name"], size=row["size"])
+
+
+def open_image_blob(conn: sqlite3.Connection, rowid: int) -> sqlite3.Blob:
+    """
+    File-like, read-only handle over the stored print (incremental blob I/O: .read(n)/.seek()),
+    for streaming it in chunks instead of materializing the whole image. Use as a context manager.
+    """
+    return conn.blobopen("trade_samples", "image_blob", rowid, readonly=True)
+
+
 def delete_trade(conn: sqlite3.Connection, trade_id: str) -> None:
     conn.execute("DELETE FROM trade_samples WHERE trade_id = ?", (trade_id,))
     conn.commit()
@@ -214,7 +344,7 @@ def update_image(
     image_name: str | None,
 ) -> None:
     conn.execute(
-        "UPDATE trade_samples SET image_blob = ?, image_mime = ?, image_name = ? WHERE trade_id = ?",
-        (image_blob, image_mime, image_name, trade_id),
+        "UPDATE trade_samples SET image_blob = ?, image_mime = ?, image_name = ?, image_sha = ? WHERE trade_id = ?",
+        (image_blob, image_mime, image_name, _image_sha(image_blob), trade_id),
     )
     conn.commit()
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import heapq
+from dataclasses import dataclass, field
 from datetime import datetime
-from math import sqrt
-from statistics import mean, median
+from math import fsum, sqrt
+from operator import itemgetter
+from statistics import median
 from typing import Any
 
 from trade_journal_db import TradeSample
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TradeFeatures:
     trade_id: str
     hour: int
@@ -29,6 +31,11 @@ class TradeFeatures:
     entry_level_dist: float | None
     entry_level_dist_atr: float | None
     result_r: float | None
+    # Distance vector, built once per instance instead of once per nearest_neighbors pair.
+    vec: tuple[float, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "vec", _vec(self))
 
 
 def _parse_iso(dt: str) -> datetime:
@@ -39,37 +46,47 @@ def _parse_iso(dt: str) -> datetime:
     return datetime.fromisoformat(s)
 
 
-def _safe_div(a: float, b: float) -> float | None:
-    if b == 0:
-        return None
-    return a / b
+def _hour_iso(dt: str) -> int:
+    # Stored timestamps are isoformat() output, so the hour sits at [11:13]; anything else goes through _parse_iso.
+    s = (dt or "").strip()
+    if len(s) >= 16 and s[4] == "-" == s[7] and s[10] in "T " and s[13] == ":" and s[11:13].isdigit():
+        hour = int(s[11:13])
+        if hour < 24:
+            return hour
+    return int(_parse_iso(s).hour)
 
 
 def extract_features(trades: list[TradeSample], default_round_step: float = 10.0) -> list[TradeFeatures]:
     out: list[TradeFeatures] = []
+    default_step = float(default_round_step)
     for t in trades:
-        dt = _parse_iso(t.dt_lisbon)
-        hour = int(dt.hour)
+        hour = _hour_iso(t.dt_lisbon)
         direction_sign = 1 if t.direction.upper() == "LONG" else -1
 
-        risk = abs(float(t.entry) - float(t.sl))
-        reward = abs(float(t.tp) - float(t.entry))
+        # Each raw column is converted once and reused below.
+        entry = float(t.entry)
+        risk = abs(entry - float(t.sl))
+        reward = abs(float(t.tp) - entry)
         rr = reward / risk if risk > 0 else 0.0
 
-        atr = float(t.atr14) if t.atr14 is not None and float(t.atr14) > 0 else None
-        risk_atr = _safe_div(risk, atr) if atr is not None else None
-        reward_atr = _safe_div(reward, atr) if atr is not None else None
+        atr = float(t.atr14) if t.atr14 is not None else None
+        if atr is not None and not atr > 0:
+            atr = None
+        risk_atr = risk / atr if atr is not None else None
+        reward_atr = reward / atr if atr is not None else None
 
         entry_round_dist = None
-        step = float(t.psych_step) if t.psych_step is not None and float(t.psych_step) > 0 else float(default_round_step)
+        step = float(t.psych_step) if t.psych_step is not None else 0.0
+        if not step > 0:
+            step = default_step
         if step and step > 0:
-            nearest = round(float(t.entry) / float(step)) * float(step)
-            entry_round_dist = abs(float(t.entry) - nearest)
+            entry_round_dist = abs(entry - round(entry / step) * step)
 
         entry_level_dist = None
         entry_level_dist_atr = None
-        if t.psych_level is not None and float(t.psych_level) > 0:
-            entry_level_dist = abs(float(t.entry) - float(t.psych_level))
+        level = float(t.psych_level) if t.psych_level is not None else 0.0
+        if level > 0:
+            entry_level_dist = abs(entry - level)
             if atr is not None:
                 entry_level_dist_atr = entry_level_dist / atr
 
@@ -83,9 +100,9 @@ def extract_features(trades: list[TradeSample], default_round_step: float = 10.0
                 touched_level=t.touched_level,
                 rejection=t.rejection,
                 confirmation=t.confirmation,
-                rr=float(rr),
-                risk=float(risk),
-                reward=float(reward),
+                rr=rr,
+                risk=risk,
+                reward=reward,
                 atr14=atr,
                 risk_atr=risk_atr,
                 reward_atr=reward_atr,
@@ -102,46 +119,64 @@ def summarize(features: list[TradeFeatures]) -> dict[str, Any]:
     if not features:
         return {"n": 0}
 
-    rr = [f.rr for f in features if f.rr > 0]
-    risk_atr = [f.risk_atr for f in features if f.risk_atr is not None]
-    reward_atr = [f.reward_atr for f in features if f.reward_atr is not None]
-    wins = [f for f in features if f.result_r is not None and f.result_r > 0]
-    losses = [f for f in features if f.result_r is not None and f.result_r <= 0]
+    # One scan over the features; mean is fsum/len instead of statistics.mean's exact Fraction arithmetic.
+    rr: list[float] = []
+    risk_atr: list[float] = []
+    reward_atr: list[float] = []
+    results: list[float] = []
+    wins = 0
+    for f in features:
+        if f.rr > 0:
+            rr.append(f.rr)
+        if f.risk_atr is not None:
+            risk_atr.append(f.risk_atr)
+        if f.reward_atr is not None:
+            reward_atr.append(f.reward_atr)
+        if f.result_r is not None:
+            results.append(f.result_r)
+            if f.result_r > 0:
+                wins += 1
+    losses = len(results) - wins
 
     return {
         "n": len(features),
         "rr_median": median(rr) if rr else None,
         "risk_atr_median": median(risk_atr) if risk_atr else None,
         "reward_atr_median": median(reward_atr) if reward_atr else None,
-        "wins": len(wins),
-        "losses": len(losses),
-        "winrate": (len(wins) / (len(wins) + len(losses))) if (wins or losses) else None,
-        "result_r_mean": mean([f.result_r for f in features if f.result_r is not None])
-        if any(f.result_r is not None for f in features)
-        else None,
+        "wins": wins,
+        "losses": losses,
+        "winrate": (wins / len(results)) if results else None,
+        "result_r_mean": fsum(results) / len(results) if results else None,
     }
 
 
-def _vec(f: TradeFeatures) -> list[float]:
+_LEVEL_SIGN = {"SUPORTE": 1.0, "RESISTENCIA": -1.0}
+
+
+def _vec(f: TradeFeatures) -> tuple[float, ...]:
     # Use only robust numeric signals. Missing ATR-dependent values become 0 and a penalty is applied via weights.
-    touched = 1.0 if f.touched_level else 0.0 if f.touched_level is not None else 0.0
-    rej = 1.0 if f.rejection else 0.0 if f.rejection is not None else 0.0
-    conf = 1.0 if f.confirmation else 0.0 if f.confirmation is not None else 0.0
-    lt = 1.0 if (f.level_type or "").upper() == "SUPORTE" else -1.0 if (f.level_type or "").upper() == "RESISTENCIA" else 0.0
-    return [
+    return (
         float(f.hour),
         float(f.timeframe_min),
         float(f.direction_sign),
-        float(lt),
-        float(touched),
-        float(rej),
-        float(conf),
+        _LEVEL_SIGN.get((f.level_type or "").upper(), 0.0),
+        1.0 if f.touched_level else 0.0,
+        1.0 if f.rejection else 0.0,
+        1.0 if f.confirmation else 0.0,
         float(f.rr),
         float(f.risk_atr if f.risk_atr is not None else 0.0),
         float(f.reward_atr if f.reward_atr is not None else 0.0),
         float(f.entry_round_dist if f.entry_round_dist is not None else 0.0),
         float(f.entry_level_dist_atr if f.entry_level_dist_atr is not None else 0.0),
-    ]
+    )
+
+
+_PESOS_PADRAO = (0.6, 0.2, 0.6, 0.5, 0.3, 0.3, 0.3, 0.8, 1.2, 1.2, 0.4, 1.0)
+
+
+def _faltas(f: TradeFeatures) -> int:
+    # Bit mask of missing ATR-dependent values: 1 risk_atr, 2 reward_atr, 4 entry_level_dist_atr.
+    return (f.risk_atr is None) | (f.reward_atr is None) << 1 | (f.entry_level_dist_atr is None) << 2
 
 
 def nearest_neighbors(
@@ -153,30 +188,45 @@ def nearest_neighbors(
     """
     Returns list of (trade_id, distance) for nearest neighbors excluding the target itself.
     """
-    weights = weights or [0.6, 0.2, 0.6, 0.5, 0.3, 0.3, 0.3, 0.8, 1.2, 1.2, 0.4, 1.0]
-    by_id = {f.trade_id: f for f in features}
-    target = by_id.get(target_id)
-    if target is None:
+    pesos = [float(w) for w in (weights or _PESOS_PADRAO)]
+    linhas = [(f.trade_id, f.vec, _faltas(f)) for f in features]
+    alvo = None
+    for linha in linhas:
+        if linha[0] == target_id:
+            alvo = linha
+    if alvo is None:
         return []
 
-    tv = _vec(target)
+    _, tv, tm = alvo
+    if len(pesos) != len(tv):
+        raise ValueError("weights must have one entry per feature")
+    pares = list(zip(pesos, tv))
     out: list[tuple[str, float]] = []
-    for f in features:
-        if f.trade_id == target_id:
+    for trade_id, v, m in linhas:
+        if trade_id == target_id:
             continue
-        v = _vec(f)
         d2 = 0.0
-        for w, a, b in zip(weights, tv, v, strict=True):
-            d2 += float(w) * (a - b) * (a - b)
+        for (w, a), b in zip(pares, v):
+            d = a - b
+            d2 += w * d * d
 
         # Penalty if either side lacks ATR
-        if (target.risk_atr is None) != (f.risk_atr is None):
-            d2 += 2.0
-        if (target.reward_atr is None) != (f.reward_atr is None):
-            d2 += 2.0
-        if (target.entry_level_dist_atr is None) != (f.entry_level_dist_atr is None):
-            d2 += 1.0
-
-        out.append((f.trade_id, sqrt(d2)))
-    out.sort(key=lambda x: x[1])
-    return out[: int(k)]
+        x = tm ^ m
+        if x:
+            if x & 1:
+                d2 += 2.0
+            if x & 2:
+                d2 += 2.0
+            if x & 4:
+                d2 += 1.0
+
+        out.append((trade_id, d2))
+    # Rank on the squared distance (sqrt is monotonic) and take the root only for the k returned.
+    k = int(k)
+    if 0 <= k < len(out):
+        # Partial selection; nsmallest is stable, so ties keep the sorted() order.
+        top = heapq.nsmallest(k, out, key=itemgetter(1))
+    else:
+        out.sort(key=itemgetter(1))
+        top = out[:k]
+    return [(trade_id, sqrt(d2)) for trade_id, d2 in top]
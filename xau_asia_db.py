@@ -13,15 +13,24 @@ class DbStats:
     max_date: str | None
 
 
+_DATA_DIR = Path(__file__).resolve().parent / "data"
+_DB_PATH = _DATA_DIR / "xauusd_asia.sqlite3"
+
+
 def db_path() -> Path:
-    data_dir = Path(__file__).resolve().parent / "data"
-    data_dir.mkdir(parents=True, exist_ok=True)
-    return data_dir / "xauusd_asia.sqlite3"
+    # Resolved once at import; mkdir stays here so a removed data/ folder is recreated.
+    _DATA_DIR.mkdir(parents=True, exist_ok=True)
+    return _DB_PATH
 
 
 def connect() -> sqlite3.Connection:
     conn = sqlite3.connect(db_path())
     conn.row_factory = sqlite3.Row
+    # WAL keeps readers unblocked during CSV/OANDA ingest; NORMAL sync is safe under WAL.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
     _init_db(conn)
     return conn
 
@@ -53,32 +62,51 @@ def _init_db(conn: sqlite3.Connection) -> None:
     conn.commit()
 
 
+# Re-imports mostly carry identical rows; the WHERE guard skips those updates so no page is rewritten.
+_UPSERT_ASIA_OPEN_DAILY = """
+    INSERT INTO asia_open_daily (
+        trade_date, open_ts_utc, open, h1_high, h1_low, h1_close, h3_high, h3_low, h3_close, atr14, source
+    ) VALUES (
+        :trade_date, :open_ts_utc, :open, :h1_high, :h1_low, :h1_close, :h3_high, :h3_low, :h3_close, :atr14, :source
+    )
+    ON CONFLICT(trade_date) DO UPDATE SET
+        open_ts_utc=excluded.open_ts_utc,
+        open=excluded.open,
+        h1_high=excluded.h1_high,
+        h1_low=excluded.h1_low,
+        h1_close=excluded.h1_close,
+        h3_high=excluded.h3_high,
+        h3_low=excluded.h3_low,
+        h3_close=excluded.h3_close,
+        atr14=excluded.atr14,
+        source=excluded.source
+    WHERE asia_open_daily.open_ts_utc IS NOT excluded.open_ts_utc
+        OR asia_open_daily.open IS NOT excluded.open
+        OR asia_open_daily.h1_high IS NOT excluded.h1_high
+        OR asia_open_daily.h1_low IS NOT excluded.h1_low
+        OR asia_open_daily.h1_close IS NOT excluded.h1_close
+        OR asia_open_daily.h3_high IS NOT excluded.h3_high
+        OR asia_open_daily.h3_low IS NOT excluded.h3_low
+        OR asia_open_daily.h3_close IS NOT excluded.h3_close
+        OR asia_open_daily.atr14 IS NOT excluded.atr14
+        OR asia_open_daily.source IS NOT excluded.source
+"""
+
+
 def upsert_asia_open_daily(conn: sqlite3.Connection, rows: Iterable[dict[str, Any]]) -> int:
-    sql = """
-        INSERT INTO asia_open_daily (
-            trade_date, open_ts_utc, open, h1_high, h1_low, h1_close, h3_high, h3_low, h3_close, atr14, source
-        ) VALUES (
-            :trade_date, :open_ts_utc, :open, :h1_high, :h1_low, :h1_close, :h3_high, :h3_low, :h3_close, :atr14, :source
-        )
-        ON CONFLICT(trade_date) DO UPDATE SET
-            open_ts_utc=excluded.open_ts_utc,
-            open=excluded.open,
-            h1_high=excluded.h1_high,
-            h1_low=excluded.h1_low,
-            h1_close=excluded.h1_close,
-            h3_high=excluded.h3_high,
-            h3_low=excluded.h3_low,
-            h3_close=excluded.h3_close,
-            atr14=excluded.atr14,
-            source=excluded.source
-    """
-    cur = conn.cursor()
-    count = 0
-    for row in rows:
-        cur.execute(sql, row)
-        count += 1
+    rows_list = list(rows)
+    if not rows_list:
+        return 0
+    # One statement prepared once and one transaction for the whole batch.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(_UPSERT_ASIA_OPEN_DAILY, rows_list)
+    except Exception:
+        conn.rollback()
+        raise
     conn.commit()
-    return count
+    return len(rows_list)
 
 
 def get_stats(conn: sqlite3.Connection) -> DbStats:
@@ -88,14 +116,18 @@ def get_stats(conn: sqlite3.Connection) -> DbStats:
     return DbStats(rows=int(row["c"]), min_date=row["min_d"], max_date=row["max_d"])
 
 
+def _fetch_dicts(conn: sqlite3.Connection, sql: str, params: tuple[Any, ...] = ()) -> list[dict[str, Any]]:
+    # Plain tuple rows zipped with the column names once, instead of sqlite3.Row -> dict per row.
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
 def fetch_last(conn: sqlite3.Connection, limit: int = 1200) -> list[dict[str, Any]]:
-    cur = conn.execute(
-        "SELECT * FROM asia_open_daily ORDER BY trade_date DESC LIMIT ?",
-        (int(limit),),
-    )
-    return [dict(r) for r in cur.fetchall()]
+    return _fetch_dicts(conn, "SELECT * FROM asia_open_daily ORDER BY trade_date DESC LIMIT ?", (int(limit),))
 
 
 def fetch_all(conn: sqlite3.Connection) -> list[dict[str, Any]]:
-    cur = conn.execute("SELECT * FROM asia_open_daily ORDER BY trade_date ASC")
-    return [dict(r) for r in cur.fetchall()]
+    return _fetch_dicts(conn, "SELECT * FROM asia_open_daily ORDER BY trade_date ASC")
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import csv
 import io
-from datetime import datetime
+from datetime import date, datetime
 from typing import Any
 
 
@@ -10,11 +10,11 @@ def _norm_key(k: str) -> str:
     return (k or "").strip().lower().replace(" ", "_")
 
 
-def _get(row: dict[str, Any], *keys: str) -> str | None:
-    for k in keys:
-        if k in row and row[k] is not None and str(row[k]).strip() != "":
-            return str(row[k]).strip()
-    return None
+def _get(row: list[str], i: int | None) -> str | None:
+    if i is None or i >= len(row):
+        return None
+    v = row[i].strip()
+    return v or None
 
 
 def _parse_float(v: str | None) -> float | None:
@@ -35,6 +35,16 @@ def _parse_date(v: str) -> str | None:
     s = (v or "").strip()
     if not s:
         return None
+    # Fast path: fixed-width YYYY-MM-DD, DD/MM/YYYY or DD-MM-YYYY picked by separator position.
+    d10 = s[:10]
+    if len(d10) == 10 and d10.isascii():
+        try:
+            if d10[4] == "-" == d10[7] and (d10[:4] + d10[5:7] + d10[8:]).isdigit():
+                return date(int(d10[:4]), int(d10[5:7]), int(d10[8:])).isoformat()
+            if d10[2] in "/-" and d10[5] == d10[2] and (d10[:2] + d10[3:5] + d10[6:]).isdigit():
+                return date(int(d10[6:]), int(d10[3:5]), int(d10[:2])).isoformat()
+        except ValueError:
+            return None
     # Prefer ISO date.
     try:
         return datetime.strptime(s[:10], "%Y-%m-%d").date().isoformat()
@@ -58,31 +68,42 @@ def read_asia_open_daily_csv(file_bytes: bytes, source: str | None = None) -> tu
     """
     notes: list[str] = []
     text = io.TextIOWrapper(io.BytesIO(file_bytes), encoding="utf-8-sig", newline="")
-    reader = csv.DictReader(text)
-    if not reader.fieldnames:
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if not header:
         return [], ["CSV sem cabecalho."]
 
-    # Normalize headers.
-    field_map: dict[str, str] = {_norm_key(f): f for f in reader.fieldnames}
+    # Normalize headers once; rows are read as plain lists and indexed by position.
+    field_idx: dict[str, int] = {_norm_key(f): i for i, f in enumerate(header)}
 
-    def col(*names: str) -> str | None:
+    def col(*names: str) -> int | None:
         for n in names:
             nk = _norm_key(n)
-            if nk in field_map:
-                return field_map[nk]
+            if nk in field_idx:
+                return field_idx[nk]
         return None
 
     date_col = col("trade_date", "date", "day")
     open_col = col("open", "open_price")
     ts_col = col("open_ts_utc", "timestamp", "ts", "time")
 
-    if not date_col or not open_col:
+    if date_col is None or open_col is None:
         return [], ["Colunas obrigatorias: date (ou trade_date) e open."]
 
+    h1_high_col = col("h1_high", "high_60m", "h1high")
+    h1_low_col = col("h1_low", "low_60m", "h1low")
+    h1_close_col = col("h1_close", "close_60m", "h1close")
+    h3_high_col = col("h3_high", "high_180m", "h3high")
+    h3_low_col = col("h3_low", "low_180m", "h3low")
+    h3_close_col = col("h3_close", "close_180m", "h3close")
+    atr_col = col("atr14", "atr_14", "atr")
+
     out: list[dict[str, Any]] = []
     bad_rows = 0
 
-    for idx, raw in enumerate(reader, start=2):
+    for raw in reader:
+        if not raw:
+            continue
         trade_date = _parse_date(_get(raw, date_col) or "")
         open_px = _parse_float(_get(raw, open_col))
         if not trade_date or open_px is None:
@@ -91,15 +112,15 @@ def read_asia_open_daily_csv(file_bytes: bytes, source: str | None = None) -> tu
 
         row: dict[str, Any] = {
             "trade_date": trade_date,
-            "open_ts_utc": _get(raw, ts_col) if ts_col else None,
+            "open_ts_utc": _get(raw, ts_col),
             "open": open_px,
-            "h1_high": _parse_float(_get(raw, col("h1_high", "high_60m", "h1high") or "")),
-            "h1_low": _parse_float(_get(raw, col("h1_low", "low_60m", "h1low") or "")),
-            "h1_close": _parse_float(_get(raw, col("h1_close", "close_60m", "h1close") or "")),
-            "h3_high": _parse_float(_get(raw, col("h3_high", "high_180m", "h3high") or "")),
-            "h3_low": _parse_float(_get(raw, col("h3_low", "low_180m", "h3low") or "")),
-            "h3_close": _parse_float(_get(raw, col("h3_close", "close_180m", "h3close") or "")),
-            "atr14": _parse_float(_get(raw, col("atr14", "atr_14", "atr") or "")),
+            "h1_high": _parse_float(_get(raw, h1_high_col)),
+            "h1_low": _parse_float(_get(raw, h1_low_col)),
+            "h1_close": _parse_float(_get(raw, h1_close_col)),
+            "h3_high": _parse_float(_get(raw, h3_high_col)),
+            "h3_low": _parse_float(_get(raw, h3_low_col)),
+            "h3_close": _parse_float(_get(raw, h3_close_col)),
+            "atr14": _parse_float(_get(raw, atr_col)),
             "source": source,
         }
         out.append(row)
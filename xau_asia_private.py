@@ -1,34 +1,221 @@
 from __future__ import annotations
 
+import io
+import os
+import sqlite3
 from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
 from zoneinfo import ZoneInfo
 
+import pandas as pd
 import streamlit as st
 
 import trade_journal_db
+from trade_journal_db import TradeSample
 from trade_pattern_analysis import extract_features, nearest_neighbors, summarize
 from operacional_xauusd import ConfiguracaoOperacional, OperacionalKillZone
 
+if TYPE_CHECKING:
+    from streamlit.runtime.uploaded_file_manager import UploadedFile
 
+T = TypeVar("T")
+
+
+_TZ_LISBON = ZoneInfo("Europe/Lisbon")
+_TZ_UTC = ZoneInfo("UTC")
+
+
+@lru_cache(maxsize=256)
 def _parse_dt_lisbon_iso(s: str) -> datetime:
-    # Stored as ISO with tz offset (Europe/Lisbon).
+    # Stored as ISO with tz offset (Europe/Lisbon). Cached: the edit tab re-parses the same value every rerun.
     v = (s or "").strip()
     if v.endswith("Z"):
         v = v[:-1] + "+00:00"
-    return datetime.fromisoformat(v).astimezone(ZoneInfo("Europe/Lisbon"))
+    return datetime.fromisoformat(v).astimezone(_TZ_LISBON)
+
+
+def _db_version() -> tuple[int, ...]:
+    # Changes on every commit: under WAL the write lands in the -wal file before the main file.
+    path = str(trade_journal_db.db_path())
+    out: list[int] = []
+    for p in (path, path + "-wal"):
+        try:
+            stt = os.stat(p)
+        except FileNotFoundError:
+            out += (0, 0)
+        else:
+            out += (stt.st_mtime_ns, stt.st_size)
+    return tuple(out)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _cached_fetch_all(
+    db_version: tuple[int, ...], _conn: sqlite3.Connection, hours: tuple[int, ...] | None = None
+) -> list[TradeSample]:
+    return trade_journal_db.fetch_all(_conn, hours)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _cached_count(db_version: tuple[int, ...], _conn: sqlite3.Connection) -> int:
+    return trade_journal_db.count(_conn)
+
+
+_KILL_ZONE_HOURS = (23, 0, 1, 2, 3)
+_THUMB_PX = 520  # 2x the 260px preview width
+_PRINT_FORMATS = ("PNG", "JPEG", "WEBP")  # what the print uploaders accept
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_thumbnail(
+    db_version: tuple[int, ...], trade_id: str, _conn: sqlite3.Connection
+) -> tuple[bytes | None, str | None] | None:
+    """
+    Downscaled PNG of the stored print plus its name, or None when there is no print.
+    Decoded in chunks from SQLite's incremental blob handle instead of one full-size bytes copy.
+    A print Pillow cannot decode (truncated, unknown format) gives (None, name) instead of raising.
+    """
+    from PIL import Image
+
+    meta = trade_journal_db.fetch_image_meta(_conn, trade_id)
+    if meta is None or not meta.size:
+        return None
+    try:
+        # Only the uploader's formats: their decoders need just read/seek, which the blob handle has.
+        with trade_journal_db.open_image_blob(_conn, meta.rowid) as fh, Image.open(fh, formats=_PRINT_FORMATS) as img:
+            img.thumbnail((_THUMB_PX, _THUMB_PX))
+            out = io.BytesIO()
+            img.save(out, format="PNG")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, meta.name
+    return out.getvalue(), meta.name
+
+
+_REGISTROS_DTYPES = {
+    "trade_id": "string",
+    "dt_lisbon": "string",
+    "symbol": "category",
+    "tf_min": "int64",
+    "dir": "category",
+    "entry": "float64",
+    "sl": "float64",
+    "tp": "float64",
+    "atr14": "float64",
+    "result_r": "float64",
+    "psych_step": "float64",
+    "psych_level": "float64",
+    "level_type": "category",
+    "touched": "boolean",
+    "rejection": "boolean",
+    "confirm": "boolean",
+    "has_img": "bool",
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _registros_df(db_version: tuple[int, ...], _trades: list[TradeSample]) -> pd.DataFrame:
+    # Built once per journal version with explicit dtypes, instead of a list of dicts re-inferred every rerun.
+    df = pd.DataFrame.from_records(
+        [
+            (
+                t.trade_id, t.dt_lisbon, t.symbol, t.timeframe_min, t.direction, t.entry, t.sl, t.tp,
+                t.atr14, t.result_r, t.psych_step, t.psych_level, t.level_type,
+                t.touched_level, t.rejection, t.confirmation, t.has_image,
+            )
+            for t in _trades
+        ],
+        columns=list(_REGISTROS_DTYPES),
+    )
+    return df.astype(_REGISTROS_DTYPES)
+
+
+def _journal_conn() -> sqlite3.Connection:
+    # One connection per browser session, reused across reruns (reruns of a session never overlap).
+    # Not st.cache_resource: a single connection shared by concurrent sessions would mix their transactions.
+    conn = st.session_state.get("_journal_conn")
+    if conn is None:
+        conn = trade_journal_db.connect(check_same_thread=False)
+        st.session_state["_journal_conn"] = conn
+    return conn
+
+
+def _clear_db_caches() -> None:
+    _cached_fetch_all.clear()
+    _cached_count.clear()
+    _cached_thumbnail.clear()
+
+
+def _session_memo(slot: str, key: tuple[Any, ...], compute: Callable[[], T]) -> T:
+    # Single-entry memo in st.session_state: reruns triggered by unrelated widgets reuse the value.
+    memo = st.session_state.get(slot)
+    if memo is None or memo[0] != key:
+        memo = (key, compute())
+        st.session_state[slot] = memo
+    return memo[1]
+
+
+def _print_para_salvar(upload: UploadedFile | None) -> tuple[bytes | None, str | None, str | None]:
+    """
+    (blob, name, mime) to store for an uploaded print, re-encoded as WebP when that is smaller:
+    lossless for PNG screenshots (chart text stays sharp), quality 82 for JPEG. Anything Pillow cannot
+    re-encode, or that would grow, is stored as uploaded.
+    """
+    if upload is None:
+        return None, None, None
+    data = upload.getvalue()
+    if upload.type in ("image/png", "image/jpeg"):
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if not getattr(img, "is_animated", False):
+                    out = io.BytesIO()
+                    if upload.type == "image/png":
+                        img.save(out, format="WEBP", lossless=True, method=4)
+                    else:
+                        img.save(out, format="WEBP", quality=82, method=4)
+                    webp = out.getvalue()
+                    if len(webp) < len(data):
+                        return webp, os.path.splitext(upload.name)[0] + ".webp", "image/webp"
+        except (OSError, ValueError):
+            pass
+    return data, upload.name, upload.type
 
 
 @st.dialog("Print")
 def _show_print_dialog(blob: bytes, caption: str) -> None:
-    st.image(blob, caption=caption, use_container_width=True)
+    try:
+        st.image(blob, caption=caption, use_container_width=True)
+    except Exception:
+        st.warning("Nao foi possivel exibir este print.")
+        st.download_button("Baixar arquivo original", data=blob, file_name=caption)
+
+
+def _render_print_preview(conn: sqlite3.Connection, db_version: tuple[int, ...], trade_id: str, button_key: str) -> bool:
+    # Thumbnail only; the full-resolution bytes are read just when the dialog is opened.
+    thumb = _cached_thumbnail(db_version, trade_id, conn)
+    if thumb is None:
+        return False
+    png, name = thumb
+    if png is not None:
+        st.image(png, caption=name or trade_id, width=260)
+    else:
+        st.caption(f"Print salvo ({name or trade_id}), mas sem miniatura: o arquivo nao pode ser decodificado.")
+    if st.button("Abrir print", key=button_key):
+        blob, _, _ = trade_journal_db.fetch_image(conn, trade_id)
+        if blob:
+            _show_print_dialog(blob, name or trade_id)
+    return True
 
 
 def render_private_xau_asia_entry_agent() -> None:
     st.header("Gestao Privada")
     st.caption("Objetivo: registrar entradas reais (prints) e extrair o operacional que se repete na Kill Zone Asia (23:00-03:00 PT).")
 
-    conn = trade_journal_db.connect()
-    st.metric("Trades cadastrados", trade_journal_db.count(conn))
+    conn = _journal_conn()
+    # Reads go through st.cache_data keyed by the DB file version; writes below clear them.
+    db_version = _db_version()
+    st.metric("Trades cadastrados", _cached_count(db_version, conn))
 
     tab_add, tab_matrix, tab_oper, tab_list = st.tabs(["Cadastrar", "Matriz", "Operacional", "Registros"])
 
@@ -85,9 +272,9 @@ def render_private_xau_asia_entry_agent() -> None:
             elif entry <= 0 or sl <= 0 or tp <= 0:
                 st.error("Entry/SL/TP precisam ser > 0.")
             else:
-                tz = ZoneInfo("Europe/Lisbon")
-                dt_local = datetime.combine(dt_date, dt_time).replace(tzinfo=tz)
-                dt_utc = dt_local.astimezone(ZoneInfo("UTC"))
+                dt_local = datetime.combine(dt_date, dt_time).replace(tzinfo=_TZ_LISBON)
+                dt_utc = dt_local.astimezone(_TZ_UTC)
+                image_blob, image_name, image_mime = _print_para_salvar(image)
 
                 row = {
                     "trade_id": trade_id.strip(),
@@ -108,11 +295,12 @@ def render_private_xau_asia_entry_agent() -> None:
                     "atr14": float(atr14) if atr14 and atr14 > 0 else None,
                     "result_r": float(result_r),
                     "notes": notes.strip() if notes.strip() else None,
-                    "image_name": image.name if image is not None else None,
-                    "image_mime": image.type if image is not None else None,
-                    "image_blob": image.getvalue() if image is not None else None,
+                    "image_name": image_name,
+                    "image_mime": image_mime,
+                    "image_blob": image_blob,
                 }
                 trade_journal_db.upsert_trade_samples(conn, [row])
+                _clear_db_caches()
                 st.success("Trade salvo.")
 
     with tab_matrix:
@@ -122,7 +310,7 @@ def render_private_xau_asia_entry_agent() -> None:
             "alem de numeração psicológica quando preenchida."
         )
 
-        trades = trade_journal_db.fetch_all(conn)
+        trades = _cached_fetch_all(db_version, conn)
         if not trades:
             st.info("Cadastre trades na aba `Cadastrar` para habilitar a matriz.")
         else:
@@ -132,11 +320,19 @@ def render_private_xau_asia_entry_agent() -> None:
             with colf2:
                 default_step = st.number_input("Step default (USD)", min_value=0.0, value=10.0, step=1.0)
 
-            feats = extract_features(trades, default_round_step=float(default_step))
-            if only_asia:
-                feats = [f for f in feats if (f.hour >= 23 or f.hour <= 3)]
+            # Kill Zone filter runs in SQL on the hour_lisbon column instead of over every extracted trade.
+            hours = _KILL_ZONE_HOURS if only_asia else None
+            if hours is not None:
+                trades = _cached_fetch_all(db_version, conn, hours)
+            # Everything below depends only on the journal version and these widgets.
+            matriz_key = (db_version, float(default_step), hours)
+            feats = _session_memo(
+                "_matriz_feats",
+                matriz_key,
+                lambda: extract_features(trades, default_round_step=float(default_step)),
+            )
 
-            st.write(summarize(feats))
+            st.write(_session_memo("_matriz_resumo", matriz_key, lambda: summarize(feats)))
 
             ids = [f.trade_id for f in feats]
             if not ids:
@@ -148,13 +344,13 @@ def render_private_xau_asia_entry_agent() -> None:
                 with colm2:
                     k = st.number_input("Top K similares", min_value=1, max_value=25, value=8, step=1)
 
-                nn = nearest_neighbors(feats, target_id=target_id, k=int(k))
+                nn = _session_memo(
+                    "_matriz_nn",
+                    (*matriz_key, target_id, int(k)),
+                    lambda: nearest_neighbors(feats, target_id=target_id, k=int(k)),
+                )
 
-                blob, _, name = trade_journal_db.fetch_image(conn, target_id)
-                if blob:
-                    st.image(blob, caption=name or target_id, width=260)
-                    if st.button("Abrir print", key=f"open_print_matrix_{target_id}"):
-                        _show_print_dialog(blob, name or target_id)
+                _render_print_preview(conn, db_version, target_id, f"open_print_matrix_{target_id}")
 
                 if nn:
                     st.write("Mais parecidos (distancia menor = mais parecido):")
@@ -171,7 +367,7 @@ def render_private_xau_asia_entry_agent() -> None:
 
         col1, col2, col3 = st.columns(3)
         with col1:
-            now_time = st.time_input("Hora atual (Portugal)", value=datetime.now(ZoneInfo("Europe/Lisbon")).time().replace(microsecond=0))
+            now_time = st.time_input("Hora atual (Portugal)", value=datetime.now(_TZ_LISBON).time().replace(microsecond=0))
             preco_atual = st.number_input("Preco atual", min_value=0.0, value=0.0, step=0.01)
             permitted, janela_label, janela_dir = op.janela_atual(now_time)
             st.caption(f"Janela: {janela_label or '-'} | Direcao esperada: {janela_dir or '-'}")
@@ -214,51 +410,25 @@ def render_private_xau_asia_entry_agent() -> None:
 
     with tab_list:
         st.subheader("Registros (Tabela)")
-        trades = trade_journal_db.fetch_all(conn)
+        trades = _cached_fetch_all(db_version, conn)
         if not trades:
             st.info("Nenhum trade cadastrado ainda.")
         else:
-            rows = []
-            for t in trades:
-                rows.append(
-                    {
-                        "trade_id": t.trade_id,
-                        "dt_lisbon": t.dt_lisbon,
-                        "symbol": t.symbol,
-                        "tf_min": t.timeframe_min,
-                        "dir": t.direction,
-                        "entry": t.entry,
-                        "sl": t.sl,
-                        "tp": t.tp,
-                        "atr14": t.atr14,
-                        "result_r": t.result_r,
-                        "psych_step": t.psych_step,
-                        "psych_level": t.psych_level,
-                        "level_type": t.level_type,
-                        "touched": t.touched_level,
-                        "rejection": t.rejection,
-                        "confirm": t.confirmation,
-                        "has_img": t.has_image,
-                    }
-                )
-            st.dataframe(rows, use_container_width=True, hide_index=True)
+            st.dataframe(_registros_df(db_version, trades), use_container_width=True, hide_index=True)
 
             st.divider()
             st.subheader("Editar Registro")
             st.caption("Edicao sobrescreve os campos do trade selecionado. Para trocar/remover o print, use os botoes abaixo.")
 
-            trade_ids = [t.trade_id for t in trades]
+            by_id = {t.trade_id: t for t in trades}
+            trade_ids = list(by_id)
             edit_id = st.selectbox("Trade ID", options=trade_ids, index=len(trade_ids) - 1)
-            current = next((t for t in trades if t.trade_id == edit_id), None)
+            current = by_id.get(edit_id)
             if current is None:
                 st.error("Trade nao encontrado.")
                 return
 
-            blob, _, name = trade_journal_db.fetch_image(conn, edit_id)
-            if blob:
-                st.image(blob, caption=name or edit_id, width=260)
-                if st.button("Abrir print", key=f"open_print_edit_{edit_id}"):
-                    _show_print_dialog(blob, name or edit_id)
+            has_print = _render_print_preview(conn, db_version, edit_id, f"open_print_edit_{edit_id}")
 
             dt_local = _parse_dt_lisbon_iso(current.dt_lisbon)
 
@@ -340,22 +510,24 @@ def render_private_xau_asia_entry_agent() -> None:
 
             colb1, colb2 = st.columns(2)
             with colb1:
-                if blob and st.button("Remover print"):
+                if has_print and st.button("Remover print"):
                     trade_journal_db.update_image(conn, edit_id, image_blob=None, image_mime=None, image_name=None)
+                    _clear_db_caches()
                     st.success("Print removido.")
             with colb2:
                 confirm_delete = st.checkbox("Confirmar exclusao", value=False)
                 if st.button("Apagar trade") and confirm_delete:
                     trade_journal_db.delete_trade(conn, edit_id)
+                    _clear_db_caches()
                     st.success("Trade apagado.")
 
             if save:
                 if entry <= 0 or sl <= 0 or tp <= 0:
                     st.error("Entry/SL/TP precisam ser > 0.")
                 else:
-                    tz = ZoneInfo("Europe/Lisbon")
-                    dt_new_local = datetime.combine(dt_date, dt_time).replace(tzinfo=tz)
-                    dt_new_utc = dt_new_local.astimezone(ZoneInfo("UTC"))
+                    dt_new_local = datetime.combine(dt_date, dt_time).replace(tzinfo=_TZ_LISBON)
+                    dt_new_utc = dt_new_local.astimezone(_TZ_UTC)
+                    image_blob, image_name, image_mime = _print_para_salvar(replace_img)
 
                     row = {
                         "trade_id": edit_id,
@@ -376,9 +548,10 @@ def render_private_xau_asia_entry_agent() -> None:
                         "atr14": float(atr14) if atr14 and atr14 > 0 else None,
                         "result_r": float(result_r),
                         "notes": notes.strip() if notes.strip() else None,
-                        "image_name": replace_img.name if replace_img is not None else None,
-                        "image_mime": replace_img.type if replace_img is not None else None,
-                        "image_blob": replace_img.getvalue() if replace_img is not None else None,
+                        "image_name": image_name,
+                        "image_mime": image_mime,
+                        "image_blob": image_blob,
                     }
                     trade_journal_db.upsert_trade_samples(conn, [row])
+                    _clear_db_caches()
                     st.success("Alteracoes salvas.")
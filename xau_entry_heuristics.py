@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from operator import itemgetter
 from statistics import median
 from typing import Any
 
 
-@dataclass(frozen=True)
+_H1_FIELDS = itemgetter("open", "h1_high", "h1_low", "h1_close")
+
+
+@dataclass(frozen=True, slots=True)
 class EntryPlan:
     direction: str  # LONG / SHORT / NEUTRAL
     entry: float
@@ -34,9 +38,11 @@ def _round_to_step(price: float, step: float, direction: str) -> float:
     if step <= 0:
         return price
     k = price / step
+    i = int(k)
     if direction == "down":
-        return (int(k) if k == int(k) else int(k)) * step
-    return (int(k) + (0 if k == int(k) else 1)) * step
+        return i * step
+    # int() truncates; bump by one step unless k was already whole.
+    return (i + (i != k)) * step
 
 
 def build_entry_plan(
@@ -68,37 +74,63 @@ def build_entry_plan(
             stats={},
         )
 
-    # Filter for rows that have at least H1 high/low/close.
-    rows_h1 = [
-        r
-        for r in history
-        if r.get("open") is not None
-        and r.get("h1_high") is not None
-        and r.get("h1_low") is not None
-        and r.get("h1_close") is not None
-    ]
-    if len(rows_h1) < 50:
+    # Numeric parameters converted once; round_step is left as given (an int step keeps int round levels).
+    min_rr = float(min_rr)
+    round_proximity = float(round_proximity)
+    contract_size = float(contract_size)
+
+    # Single pass over history: the float H1 columns and atr14 of rows that have all four fields, not the dicts.
+    opens: list[float] = []
+    highs: list[float] = []
+    lows: list[float] = []
+    closes: list[float] = []
+    h1_atrs: list[float | None] = []
+    for r in history:
+        try:
+            fields = _H1_FIELDS(r)
+        except KeyError:
+            continue  # a missing column counts as None
+        if None in fields:
+            continue
+        o, h, lo, c = fields
+        opens.append(float(o))
+        highs.append(float(h))
+        lows.append(float(lo))
+        closes.append(float(c))
+        atr = r.get("atr14")
+        h1_atrs.append(None if atr is None else float(atr))
+    h1_rows = len(opens)
+    if h1_rows < 50:
         notes.append("Poucos registros com H1 (h1_high/h1_low/h1_close). Melhor importar CSV com colunas H1.")
 
-    rows_for_stats = rows_h1 if rows_h1 else [r for r in history if r.get("open") is not None]
+    up_moves = [h - o for h, o in zip(highs, opens)]
+    down_moves = [o - lo for o, lo in zip(opens, lows)]
+
+    # Near-round mask over the opens, with _nearest_round inlined (step <= 0 leaves the price as is).
+    if round_step > 0:
+        near = [abs(o - round(o / round_step) * round_step) <= round_proximity for o in opens]
+    else:
+        near = [round_proximity >= 0] * len(opens)
+
+    # One pass over open/close for the close direction and the round-number bias stats.
+    # Bools count as 0/1, so up closes are summed without a branch; close direction sum = ups - downs.
+    up_closes = 0
+    near_count = 0
+    near_wins = 0
+    for o, c, is_near in zip(opens, closes, near):
+        up_close = c > o
+        up_closes += up_close
+        if is_near:
+            near_count += 1
+            near_wins += up_close
+    close_dir_sum = 2 * up_closes - h1_rows
 
-    up_moves: list[float] = []
-    down_moves: list[float] = []
     up_moves_atr: list[float] = []
     down_moves_atr: list[float] = []
-    close_dir: list[int] = []
-
-    for r in rows_h1:
-        o = float(r["open"])
-        up = float(r["h1_high"]) - o
-        down = o - float(r["h1_low"])
-        up_moves.append(up)
-        down_moves.append(down)
-        atr = r.get("atr14")
-        if atr is not None and float(atr) > 0:
-            up_moves_atr.append(up / float(atr))
-            down_moves_atr.append(down / float(atr))
-        close_dir.append(1 if float(r["h1_close"]) > o else -1)
+    for atr, up, down in zip(h1_atrs, up_moves, down_moves):
+        if atr is not None and atr > 0:
+            up_moves_atr.append(up / atr)
+            down_moves_atr.append(down / atr)
 
     med_up = median(up_moves) if up_moves else None
     med_down = median(down_moves) if down_moves else None
@@ -107,11 +139,14 @@ def build_entry_plan(
 
     # Use the most recent ATR as current volatility regime reference.
     current_atr = None
-    for r in history:
+    for r in reversed(history):
         atr = r.get("atr14")
-        if atr is not None and float(atr) > 0:
-            current_atr = float(atr)
-    if current_atr is None and rows_h1:
+        if atr is not None:
+            atr = float(atr)
+            if atr > 0:
+                current_atr = atr
+                break
+    if current_atr is None and h1_rows:
         # Fallback: infer from median absolute moves.
         if med_up is not None and med_down is not None:
             current_atr = max(med_up, med_down) * 2.0
@@ -121,33 +156,20 @@ def build_entry_plan(
             current_atr = med_down * 2.0
 
     nearest = _nearest_round(reference_price, round_step)
-    near_round = abs(reference_price - nearest) <= float(round_proximity)
-
-    # Round-number bias stats.
-    near_rows = []
-    if rows_h1:
-        for r in rows_h1:
-            o = float(r["open"])
-            o_nearest = _nearest_round(o, round_step)
-            if abs(o - o_nearest) <= float(round_proximity):
-                near_rows.append(r)
-
-    long_winrate = None
-    if near_rows:
-        wins = 0
-        for r in near_rows:
-            wins += 1 if float(r["h1_close"]) > float(r["open"]) else 0
-        long_winrate = wins / len(near_rows)
+    near_round = abs(reference_price - nearest) <= round_proximity
+
+    # Round-number bias stats (counted in the H1 pass above).
+    long_winrate = near_wins / near_count if near_count else None
 
     direction = "NEUTRAL"
-    if long_winrate is not None and len(near_rows) >= 80:
+    if long_winrate is not None and near_count >= 80:
         if long_winrate >= 0.55:
             direction = "LONG"
         elif long_winrate <= 0.45:
             direction = "SHORT"
-    elif rows_h1:
+    elif h1_rows:
         # Fallback to overall close direction.
-        overall = sum(close_dir) / len(close_dir)
+        overall = close_dir_sum / h1_rows
         if overall >= 0.05:
             direction = "LONG"
         elif overall <= -0.05:
@@ -180,16 +202,16 @@ def build_entry_plan(
 
     if direction == "LONG":
         stop = entry - stop_distance
-        take_profit = entry + stop_distance * float(min_rr)
+        take_profit = entry + stop_distance * min_rr
     elif direction == "SHORT":
         stop = entry + stop_distance
-        take_profit = entry - stop_distance * float(min_rr)
+        take_profit = entry - stop_distance * min_rr
     else:
         # Neutral: propose symmetric bracket.
         stop = entry - stop_distance
-        take_profit = entry + stop_distance * float(min_rr)
+        take_profit = entry + stop_distance * min_rr
 
-    rr = float(min_rr) if stop_distance > 0 else 0.0
+    rr = min_rr if stop_distance > 0 else 0.0
 
     # Round TP to a favorable round number (optional).
     if round_step > 0:
@@ -200,26 +222,26 @@ def build_entry_plan(
 
     # Ensure RR >= min_rr after rounding.
     effective_rr = abs(take_profit - entry) / abs(entry - stop) if abs(entry - stop) > 0 else 0.0
-    if effective_rr + 1e-9 < float(min_rr):
+    if effective_rr + 1e-9 < min_rr:
         # Undo rounding if it violated RR.
         if direction == "LONG":
-            take_profit = entry + stop_distance * float(min_rr)
+            take_profit = entry + stop_distance * min_rr
         elif direction == "SHORT":
-            take_profit = entry - stop_distance * float(min_rr)
-        effective_rr = float(min_rr)
+            take_profit = entry - stop_distance * min_rr
+        effective_rr = min_rr
 
     lots = None
     risk_amount = None
     if account_balance is not None and risk_percent is not None:
         risk_amount = float(account_balance) * float(risk_percent) / 100.0
-        denom = stop_distance * float(contract_size)
+        denom = stop_distance * contract_size
         if denom > 0:
             lots = risk_amount / denom
 
     stats = {
         "history_rows": len(history),
-        "h1_rows": len(rows_h1),
-        "near_round_rows": len(near_rows),
+        "h1_rows": h1_rows,
+        "near_round_rows": near_count,
         "near_round_long_winrate": long_winrate,
         "median_up_h1": med_up,
         "median_down_h1": med_down,